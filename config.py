@@ -2,6 +2,8 @@
 ALGORITHM_VERSION = 'CONSTRAINTS' # 'GREEDY' o 'CONSTRAINTS'
 ENABLE_EVENING_RESTRICTION = True
 MAX_CONSECUTIVE_SLOTS = 3
+LOG_LEVEL = 'WARNING' # Nivel de logging del servicio ('DEBUG' muestra el detalle por bloque)
+SOLVER_DATA_CACHE_TTL = 300 # Segundos que se reutilizan los datos del solver si la huella no cambia
 
 # --- Configuración de la Base de Datos ---
 
@@ -1,35 +1,46 @@
-from pydantic import BaseModel, conint
+from dataclasses import dataclass
 from typing import List, Optional, Dict 
 
-class TimeSlot(BaseModel):
+# Contenedores de datos internos (sin validación): se construyen desde la BD
+# y solo los consume el solver, así que usamos dataclasses con __slots__.
+
+@dataclass(slots=True)
+class TimeSlot:
     id: int
     day: str
     start_time: str
     end_time: str
+    day_id: int  # 1 = Lunes ... 5 = Viernes (slot_id // 1000)
+    hour: int    # Hora entera de inicio (slot_id % 1000)
 
-class Course(BaseModel):
+@dataclass(slots=True)
+class Course:
     id: int
     name: str
-    weekly_hours: conint(gt=0)
-    min_block_duration: conint(gt=0)
-    max_block_duration: conint(gt=0)
+    weekly_hours: int
+    min_block_duration: int
+    max_block_duration: int
     required_room_type: str  # "tronco_comun" o "especialidad"
     professor_id: Optional[int] = None  # Ahora es opcional (se define por grupo)
 
-class Room(BaseModel):
+@dataclass(slots=True)
+class Room:
     id: int
     name: str
     capacity: int
     type: str  # Tipo de edificio: "tronco_comun", "especialidad", etc.
     building_name: Optional[str] = "N/A"
 
-class Professor(BaseModel):
+@dataclass(slots=True)
+class Professor:
     id: int
     name: str
     availability: List[int]
-    max_load: conint(gt=0)
+    max_load: int
+    unavail_mask: int = 0  # Bit i = slot no disponible (i según build_slot_index)
 
-class ProfessorCourseGroupAssignment(BaseModel):
+@dataclass(slots=True)
+class ProfessorCourseGroupAssignment:
     """Representa la asignación de un profesor a una materia para un grupo específico."""
     id: int  # id de profesor_asignatura_grupo
     professor_id: int
@@ -37,11 +48,16 @@ class ProfessorCourseGroupAssignment(BaseModel):
     group_id: int
     professor_asignatura_id: int  # id de profesor_asignatura
 
-class Group(BaseModel):
+@dataclass(slots=True)
+class Group:
     """Representa un grupo de estudiantes."""
     id: int
     name: str
     tutor: Optional[str] = "N/A"
     
+def build_slot_index(timeslots: List[TimeSlot]) -> Dict[int, int]:
+    """Índice denso de cada slot (posición de su bit en las máscaras), por id ascendente."""
+    return {t.id: i for i, t in enumerate(sorted(timeslots, key=lambda t: t.id))}
+
 # Modelo para el resultado del horario
-ScheduleResult = Dict[str, tuple]  # {unique_id: (TimeSlot ID, Room ID, Course ID)}
\ No newline at end of file
+ScheduleResult = Dict[str, tuple]  # {unique_id: (TimeSlot ID, Room ID, Course ID, Block ID)}
\ No newline at end of file
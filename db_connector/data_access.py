@@ -1,101 +1,271 @@
-from typing import Dict, List
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import text 
-from data_service.models import Course, Room, Professor, TimeSlot, ProfessorCourseGroupAssignment, Group
+from db_connector.database import SessionLocal
+from data_service.models import Course, Room, Professor, TimeSlot, ProfessorCourseGroupAssignment, Group, build_slot_index
+from config import SOLVER_DATA_CACHE_TTL
 
-def fetch_all_data_for_solver(db: Session) -> Dict[str, List]:
+log = logging.getLogger(__name__)
+
+# Caché en memoria de fetch_all_data_for_solver: {'fp': huella, 'loaded_at': epoch, 'data': dict}
+_CACHE: Dict = {}
+
+# Tablas que lee el loader (edificio entra por el JOIN de ROOMS_QUERY)
+_FINGERPRINT_TABLES = (
+    "turno", "profesor", "horario_profesor", "aula", "edificio", "profesor_aula",
+    "asignatura", "grupo", "profesor_asignatura", "profesor_asignatura_grupo",
+)
+
+# Huella barata de las tablas que lee el loader, un recorrido por tabla: COUNT(*) detecta
+# DELETE y MAX(xmin) (transacción de la última versión escrita) detecta INSERT y UPDATE
+# in-place, ej. mover un slot no disponible o cambiar horas_semanales. Sin convertir
+# ni ordenar filas; el TTL queda como respaldo (ej. wraparound de xmin).
+FINGERPRINT_QUERY = "SELECT " + ",\n    ".join(
+    f"(SELECT COUNT(*) || ':' || COALESCE(MAX(xmin::text::bigint), 0) FROM {table})"
+    for table in _FINGERPRINT_TABLES
+) + ";"
+
+
+# Las lecturas del loader son independientes: se lanzan a la vez, cada una con
+# su propia conexión del pool, y el tiempo total tiende al de la más lenta.
+_LOADER_POOL = ThreadPoolExecutor(max_workers=7, thread_name_prefix="solver-loader")
+
+# El turno solo aporta los límites (días y horas); la malla de slots
+# se expande en Python en lugar de usar generate_series en la BD.
+TURNOS_QUERY = """
+SELECT 
+    dia_inicio, 
+    dia_fin, 
+    EXTRACT(HOUR FROM hora_inicio) AS hora_inicio, 
+    EXTRACT(HOUR FROM hora_fin) AS hora_fin
+FROM 
+    turno
+WHERE 
+    EXTRACT(HOUR FROM hora_inicio) >= 17 
+    AND EXTRACT(HOUR FROM hora_fin) <= 22;
+"""
+
+# Una fila por profesor con sus slots NO disponibles ya agregados en la BD.
+# Si disponible = FALSE, el profesor NO está disponible en ese slot;
+# si disponible = TRUE o NULL, el profesor SÍ está disponible.
+PROFESSORS_QUERY = """
+SELECT 
+    p.id, 
+    p.abreviatura_nombre, 
+    COALESCE(
+        array_agg(hp.dia * 1000 + EXTRACT(HOUR FROM hp.hora)::int) 
+            FILTER (WHERE hp.disponible IS FALSE AND hp.dia IS NOT NULL AND hp.hora IS NOT NULL),
+        '{}'::int[]
+    ) AS unavailable
+FROM 
+    profesor p
+LEFT JOIN 
+    horario_profesor hp ON p.id = hp.id_profesor
+GROUP BY p.id, p.abreviatura_nombre
+ORDER BY p.id;
+"""
+
+ROOMS_QUERY = """
+SELECT 
+    a.id, 
+    a.nombre, 
+    a.capacidad, 
+    COALESCE(NULLIF(e.tipo, ''), a.abreviatura) AS tipo,
+    e.nombre AS nombre_edificio
+FROM 
+    aula a
+JOIN 
+    edificio e ON a.id_edificio = e.id
+ORDER BY e.tipo, a.id;
+"""
+
+PROFESSOR_ROOMS_QUERY = """
+SELECT 
+    id_profesor,
+    id_aula,
+    id_periodo
+FROM 
+    profesor_aula
+WHERE 
+    id_periodo = 1;
+"""
+
+COURSES_QUERY = """
+SELECT 
+    a.id, 
+    a.nombre, 
+    a.horas_semanales,
+    a.duracion_bloque_horas_min,
+    a.duracion_bloque_horas_max,
+    a.tipo
+FROM 
+    asignatura a
+LIMIT 100;
+"""
+
+GROUPS_QUERY = """
+SELECT 
+    id, nombre
+FROM 
+    grupo;
+"""
+
+ASSIGNMENTS_QUERY = """
+SELECT 
+    pag.id,
+    pa.id_profesor,
+    pa.id_asignatura,
+    pag.id_grupo,
+    pag.id_profesor_asignatura
+FROM 
+    profesor_asignatura_grupo pag
+JOIN 
+    profesor_asignatura pa ON pag.id_profesor_asignatura = pa.id
+ORDER BY pag.id_grupo, pa.id_asignatura;
+"""
+
+
+def _fetch_rows(db: Session, query: str) -> List[tuple]:
+    """Ejecuta una lectura con el cursor psycopg2 de la sesión y devuelve tuplas planas (sin Row de SQLAlchemy)."""
+    cur = db.connection().connection.cursor()
+    try:
+        cur.execute(query)
+        return cur.fetchall()
+    finally:
+        cur.close()
+
+
+def _fetch_rows_own_session(query: str) -> List[tuple]:
+    """Como _fetch_rows, pero en una sesión propia (para correr en _LOADER_POOL)."""
+    with SessionLocal() as session:
+        return _fetch_rows(session, query)
+
+
+def fetch_solver_fingerprint(db: Session) -> tuple:
+    """Huella de las tablas del loader: 'conteo:max_xmin' por tabla."""
+    return tuple(_fetch_rows(db, FINGERPRINT_QUERY)[0])
+
+
+def fetch_solver_data_cached(fp: tuple) -> Dict[str, List]:
+    """
+    Devuelve los datos del solver reutilizando la última carga mientras la huella
+    `fp` (de fetch_solver_fingerprint) no cambie y no se haya superado SOLVER_DATA_CACHE_TTL.
+    La huella cambia con INSERT, UPDATE y DELETE; el TTL es un respaldo que
+    acota cuánto tiempo se retiene la carga en memoria.
+    """
+    global _CACHE
+    
+    now = time.monotonic()
+    
+    if _CACHE.get('fp') == fp and now - _CACHE['loaded_at'] < SOLVER_DATA_CACHE_TTL:
+        log.info("♻️  Datos del solver sin cambios, usando caché")
+        return _CACHE['data']
+    
+    data = fetch_all_data_for_solver()
+    _CACHE = {'fp': fp, 'loaded_at': now, 'data': data}
+    return data
+
+
+def _positive_or_default(value, default: int, field: str, course_id: int) -> int:
+    """Valor > 0 de una columna de asignatura; vacío o 0 toma el default y un negativo es un error de datos."""
+    if not value:
+        return default
+    if value < 0:
+        raise ValueError(f"Asignatura {course_id}: {field} debe ser mayor que 0 (valor {value})")
+    return value
+
+
+def fetch_all_data_for_solver() -> Dict[str, List]:
     data: Dict[str, List] = {}
     
     DAY_MAP = {1: "Lunes", 2: "Martes", 3: "Miércoles", 4: "Jueves", 5: "Viernes"}
     
+    # Lanzar todas las lecturas en paralelo (cada una en su propia sesión);
+    # cada sección espera solo la suya
+    loads = {
+        name: _LOADER_POOL.submit(_fetch_rows_own_session, query)
+        for name, query in (
+            ('turnos', TURNOS_QUERY),
+            ('professors', PROFESSORS_QUERY),
+            ('rooms', ROOMS_QUERY),
+            ('professor_rooms', PROFESSOR_ROOMS_QUERY),
+            ('courses', COURSES_QUERY),
+            ('groups', GROUPS_QUERY),
+            ('assignments', ASSIGNMENTS_QUERY),
+        )
+    }
+    
     # ============================================
     # 1. GENERAR PERIODOS DE TIEMPO (TimeSlots)
     # ============================================
-    timeslots_query = """
-    SELECT 
-        (d.day_id * 1000 + EXTRACT(HOUR FROM slot_start)) AS id_slot,
-        d.day_id AS day_id,
-        slot_start::time AS start_time 
-    FROM 
-        turno t,
-        generate_series(
-            '2000-01-01'::date + t.hora_inicio, 
-            '2000-01-01'::date + t.hora_fin - interval '1 hour', 
-            interval '1 hour'
-        ) AS slot_start
-    JOIN 
-        (SELECT generate_series(t.dia_inicio::integer, t.dia_fin::integer) AS day_id FROM turno t GROUP BY 1) d ON true
-    WHERE 
-        EXTRACT(HOUR FROM t.hora_inicio) >= 17 
-        AND EXTRACT(HOUR FROM t.hora_fin) <= 22
-    ORDER BY id_slot;
-    """
 
-    timeslots_data = db.execute(text(timeslots_query)).fetchall()
+    turnos_data = loads['turnos'].result()
+    
+    slot_hours = {}
+    for dia_inicio, dia_fin, hora_inicio, hora_fin in turnos_data:
+        for day_id in range(int(dia_inicio), int(dia_fin) + 1):
+            for hour in range(int(hora_inicio), int(hora_fin)):
+                slot_hours[day_id * 1000 + hour] = (day_id, hour)
     
     data['timeslots'] = [TimeSlot(
-        id=t[0], 
-        day=DAY_MAP.get(t[1], "Desconocido"), 
-        start_time=str(t[2]), 
-        end_time=str(t[2].hour + 1) + ":00:00" 
-    ) for t in timeslots_data]
+        id=slot_id, 
+        day=DAY_MAP.get(day_id, "Desconocido"), 
+        start_time=f"{hour:02d}:00:00", 
+        end_time=f"{hour + 1}:00:00",
+        day_id=day_id,
+        hour=hour
+    ) for slot_id, (day_id, hour) in sorted(slot_hours.items())]
+    
+    # Índice denso de cada slot (posición del bit en las máscaras); el solver usa el mismo
+    data['slot_index'] = build_slot_index(data['timeslots'])
 
     # ============================================
     # 2. PROFESORES y Disponibilidad (MEJORADO)
     # ============================================
-    print("\n🔍 Cargando disponibilidad de profesores...")
+    log.info("\n🔍 Cargando disponibilidad de profesores...")
     
-    professors_query = """
-    SELECT 
-        p.id, 
-        p.abreviatura_nombre, 
-        hp.dia, 
-        EXTRACT(HOUR FROM hp.hora) AS hour_of_day,
-        hp.disponible
-    FROM 
-        profesor p
-    LEFT JOIN 
-        horario_profesor hp ON p.id = hp.id_profesor
-    ORDER BY p.id, hp.dia, hp.hora;
-    """
-    professors_data = db.execute(text(professors_query)).fetchall()
+    professors_data = loads['professors'].result()
     
+    slot_index = data['slot_index']
     professors_map = {}
-    for p_id, name, day_id, hour_of_day, disponible in professors_data:
-        if p_id not in professors_map:
-            professors_map[p_id] = {
-                "id": p_id, 
-                "name": name, 
-                "max_load": 40,
-                "availability": set()  # Slots donde NO está disponible
-            }
+    for p_id, name, unavail in professors_data:
+        unavailable = set(unavail)
+        
+        unavail_mask = 0
+        for slot_id in unavailable:
+            if slot_id in slot_index:
+                unavail_mask |= 1 << slot_index[slot_id]
         
-        # Si disponible = FALSE, el profesor NO está disponible en ese slot
-        # Si disponible = TRUE o NULL, el profesor SÍ está disponible
-        if day_id is not None and hour_of_day is not None:
-            slot_id = int(day_id * 1000 + hour_of_day)
-            
-            # Solo agregar a "availability" si NO está disponible
-            if disponible is False:
-                professors_map[p_id]["availability"].add(slot_id)
+        professors_map[p_id] = {
+            "id": p_id, 
+            "name": name, 
+            "max_load": 40,
+            "availability": unavailable,  # Slots donde NO está disponible
+            "unavail_mask": unavail_mask  # Mismos slots como bits según slot_index
+        }
     
     data['professors'] = [
         Professor(
             id=p['id'], 
             name=p['name'], 
             max_load=p['max_load'], 
-            availability=list(p['availability'])  # Lista de slots NO disponibles
+            availability=list(p['availability']),  # Lista de slots NO disponibles
+            unavail_mask=p['unavail_mask']
         ) for p in professors_map.values()
     ]
     
     # Mostrar estadísticas de disponibilidad
-    print(f"📊 Profesores cargados: {len(data['professors'])}")
-    total_slots = len(data['timeslots'])
+    log.info(f"📊 Profesores cargados: {len(data['professors'])}")
     
-    for prof in data['professors'][:5]:  # Primeros 5 profesores
-        unavailable_count = len(prof.availability)
-        available_count = total_slots - unavailable_count
-        print(f"   - {prof.name}: {available_count}/{total_slots} slots disponibles ({unavailable_count} bloqueados)")
+    if log.isEnabledFor(logging.DEBUG):
+        total_slots = len(data['timeslots'])
+        for prof in data['professors'][:5]:  # Primeros 5 profesores
+            unavailable_count = len(prof.availability)
+            available_count = total_slots - unavailable_count
+            log.debug(f"   - {prof.name}: {available_count}/{total_slots} slots disponibles ({unavailable_count} bloqueados)")
 
     # Crear mapeo de profesores para debug
     data['professor_map'] = {p.id: p.name for p in data['professors']}
@@ -103,78 +273,45 @@ def fetch_all_data_for_solver(db: Session) -> Dict[str, List]:
     # ============================================
     # 3. AULAS (Rooms)
     # ============================================
-    rooms_query = """
-    SELECT 
-        a.id, 
-        a.nombre, 
-        a.capacidad, 
-        a.abreviatura,
-        e.tipo AS tipo_edificio,
-        e.nombre AS nombre_edificio
-    FROM 
-        aula a
-    JOIN 
-        edificio e ON a.id_edificio = e.id
-    ORDER BY e.tipo, a.id;
-    """
-    rooms_data = db.execute(text(rooms_query)).fetchall()
+    rooms_data = loads['rooms'].result()
     data['rooms'] = [Room(
         id=r[0], 
         name=r[1], 
         capacity=r[2], 
-        type=r[4] if r[4] else r[3],
-        building_name=r[5] if len(r) > 5 else "N/A"
+        type=r[3],
+        building_name=r[4] or "N/A"
     ) for r in rooms_data]
 
     # ============================================
     # 3.5 AULAS ASIGNADAS A PROFESORES
     # ============================================
-    professor_rooms_query = """
-    SELECT 
-        id_profesor,
-        id_aula,
-        id_periodo
-    FROM 
-        profesor_aula
-    WHERE 
-        id_periodo = 1;
-    """
-    professor_rooms_data = db.execute(text(professor_rooms_query)).fetchall()
+    professor_rooms_data = loads['professor_rooms'].result()
     
     data['professor_rooms'] = {pr[0]: pr[1] for pr in professor_rooms_data}
     
-    print(f"\n📍 Aulas asignadas a profesores: {len(data['professor_rooms'])}")
-    if len(data['professor_rooms']) > 0:
-        print("Ejemplos:")
+    log.info(f"\n📍 Aulas asignadas a profesores: {len(data['professor_rooms'])}")
+    if len(data['professor_rooms']) > 0 and log.isEnabledFor(logging.DEBUG):
+        room_by_id = {r.id: r for r in data['rooms']}
+        log.debug("Ejemplos:")
         for i, (prof_id, room_id) in enumerate(list(data['professor_rooms'].items())[:3]):
             prof_name = data['professor_map'].get(prof_id, f"ID:{prof_id}")
-            room = next((r for r in data['rooms'] if r.id == room_id), None)
+            room = room_by_id.get(room_id)
             room_name = room.name if room else f"ID:{room_id}"
-            print(f"   {i+1}. Profesor {prof_name} → Aula {room_name}")
+            log.debug(f"   {i+1}. Profesor {prof_name} → Aula {room_name}")
 
     # ============================================
     # 4. MATERIAS (Courses)
     # ============================================
-    courses_query = """
-    SELECT 
-        a.id, 
-        a.nombre, 
-        a.horas_semanales,
-        a.duracion_bloque_horas_min,
-        a.duracion_bloque_horas_max,
-        a.tipo
-    FROM 
-        asignatura a
-    LIMIT 100;
-    """
-    courses_data = db.execute(text(courses_query)).fetchall()
+    courses_data = loads['courses'].result()
     
+    # Los modelos ya no validan: las horas y duraciones se comprueban aquí (un negativo
+    # haría que el cálculo de bloques no termine)
     data['courses'] = [Course(
         id=c[0], 
         name=c[1], 
-        weekly_hours=c[2] if c[2] else 3,
-        min_block_duration=c[3] if c[3] else 1,
-        max_block_duration=c[4] if c[4] else 2,
+        weekly_hours=_positive_or_default(c[2], 3, 'horas_semanales', c[0]),
+        min_block_duration=_positive_or_default(c[3], 1, 'duracion_bloque_horas_min', c[0]),
+        max_block_duration=_positive_or_default(c[4], 2, 'duracion_bloque_horas_max', c[0]),
         required_room_type=c[5] if c[5] else "tronco_comun",
         professor_id=None
     ) for c in courses_data]
@@ -182,13 +319,7 @@ def fetch_all_data_for_solver(db: Session) -> Dict[str, List]:
     # ============================================
     # 5. GRUPOS
     # ============================================
-    groups_query = """
-    SELECT 
-        id, nombre
-    FROM 
-        grupo;
-    """
-    groups_data = db.execute(text(groups_query)).fetchall()
+    groups_data = loads['groups'].result()
     
     data['groups'] = [Group(
         id=g[0], 
@@ -198,30 +329,17 @@ def fetch_all_data_for_solver(db: Session) -> Dict[str, List]:
     # ============================================
     # 6. ASIGNACIONES PROFESOR-MATERIA-GRUPO
     # ============================================
-    print("\n🔍 Cargando asignaciones profesor-materia-grupo...")
+    log.info("\n🔍 Cargando asignaciones profesor-materia-grupo...")
     
-    assignments_query = """
-    SELECT 
-        pag.id,
-        pa.id_profesor,
-        pa.id_asignatura,
-        pag.id_grupo,
-        pag.id_profesor_asignatura
-    FROM 
-        profesor_asignatura_grupo pag
-    JOIN 
-        profesor_asignatura pa ON pag.id_profesor_asignatura = pa.id
-    ORDER BY pag.id_grupo, pa.id_asignatura;
-    """
     
     try:
-        assignments_data = db.execute(text(assignments_query)).fetchall()
+        assignments_data = loads['assignments'].result()
         
-        print(f"📊 Registros encontrados en profesor_asignatura_grupo: {len(assignments_data)}")
+        log.info(f"📊 Registros encontrados en profesor_asignatura_grupo: {len(assignments_data)}")
         
         if len(assignments_data) == 0:
-            print("⚠️ ADVERTENCIA: No hay registros en profesor_asignatura_grupo")
-            print("   Verifica que la tabla tenga datos")
+            log.warning("⚠️ ADVERTENCIA: No hay registros en profesor_asignatura_grupo")
+            log.warning("   Verifica que la tabla tenga datos")
         
         data['professor_course_group_assignments'] = [
             ProfessorCourseGroupAssignment(
@@ -233,35 +351,83 @@ def fetch_all_data_for_solver(db: Session) -> Dict[str, List]:
             ) for a in assignments_data
         ]
         
-        if len(data['professor_course_group_assignments']) > 0:
-            print("\n📝 Ejemplos de asignaciones cargadas:")
+        if len(data['professor_course_group_assignments']) > 0 and log.isEnabledFor(logging.DEBUG):
+            course_by_id = {c.id: c for c in data['courses']}
+            group_by_id = {g.id: g for g in data['groups']}
+            log.debug("\n📝 Ejemplos de asignaciones cargadas:")
             for i, assignment in enumerate(data['professor_course_group_assignments'][:3]):
                 prof_name = data['professor_map'].get(assignment.professor_id, f"ID:{assignment.professor_id}")
-                course = next((c for c in data['courses'] if c.id == assignment.course_id), None)
+                course = course_by_id.get(assignment.course_id)
                 course_name = course.name if course else f"ID:{assignment.course_id}"
-                group = next((g for g in data['groups'] if g.id == assignment.group_id), None)
+                group = group_by_id.get(assignment.group_id)
                 group_name = group.name if group else f"ID:{assignment.group_id}"
                 
-                print(f"   {i+1}. Grupo: {group_name} | Materia: {course_name} | Profesor: {prof_name}")
+                log.debug(f"   {i+1}. Grupo: {group_name} | Materia: {course_name} | Profesor: {prof_name}")
         
     except Exception as e:
-        print(f"❌ Error al cargar asignaciones: {e}")
+        log.error(f"❌ Error al cargar asignaciones: {e}")
         data['professor_course_group_assignments'] = []
 
-    print(f"\n✅ Datos cargados: {len(data['courses'])} materias, {len(data['professors'])} profesores, {len(data['groups'])} grupos, {len(data['rooms'])} aulas")
-    print(f"✅ Asignaciones profesor-materia-grupo: {len(data['professor_course_group_assignments'])}")
+    log.info(f"\n✅ Datos cargados: {len(data['courses'])} materias, {len(data['professors'])} profesores, {len(data['groups'])} grupos, {len(data['rooms'])} aulas")
+    log.info(f"✅ Asignaciones profesor-materia-grupo: {len(data['professor_course_group_assignments'])}")
     
     # ============================================
     # 7. DISTRIBUCIÓN DE AULAS POR TIPO
     # ============================================
-    rooms_by_type = {}
-    for room in data['rooms']:
-        if room.type not in rooms_by_type:
-            rooms_by_type[room.type] = []
-        rooms_by_type[room.type].append(room.name)
+    if log.isEnabledFor(logging.DEBUG):
+        rooms_by_type = {}
+        for room in data['rooms']:
+            if room.type not in rooms_by_type:
+                rooms_by_type[room.type] = []
+            rooms_by_type[room.type].append(room.name)
+        
+        log.debug("\n📍 Aulas disponibles por tipo de edificio:")
+        for tipo, aulas in rooms_by_type.items():
+            log.debug(f"   - {tipo}: {len(aulas)} aulas")
     
-    print("\n📍 Aulas disponibles por tipo de edificio:")
-    for tipo, aulas in rooms_by_type.items():
-        print(f"   - {tipo}: {len(aulas)} aulas")
+    # ============================================
+    # 7.5 MAPEOS PARA GUARDAR / FORMATEAR RESULTADOS
+    # ============================================
+    data['course_map'] = {c.id: c.name for c in data['courses']}
+    data['room_map'] = {r.id: r.name for r in data['rooms']}
+    data['building_map'] = {r.id: r.building_name or "N/A" for r in data['rooms']}
+    data['timeslot_map'] = {ts.id: ts for ts in data['timeslots']}
+    # Día y hora ya formateados ("17:00") por slot
+    data['slot_labels'] = {
+        ts.id: (ts.day, str(ts.start_time)[:5] if ts.start_time else '00:00') 
+        for ts in data['timeslots']
+    }
+    data['course_by_id'] = {c.id: c for c in data['courses']}
+    data['assignment_by_group_course'] = {
+        (a.group_id, a.course_id): a 
+        for a in data['professor_course_group_assignments']
+    }
+    
+    return data
+
+
+def copy_schedule_rows(db: Session, rows: List[Tuple[int, int, int, int, str]]) -> int:
+    """
+    Inserta filas (id_profesor_asignatura, id_aula, id_grupo, dia, hora) en
+    horario_clases con COPY ... FROM STDIN usando el cursor psycopg2 de la sesión.
+    No hace commit: las filas quedan en la transacción actual de `db`.
+    """
+    if not rows:
+        return 0
+    
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(str(v) for v in row))
+        buf.write("\n")
+    buf.seek(0)
+    
+    cur = db.connection().connection.cursor()
+    try:
+        cur.copy_expert(
+            "COPY horario_clases (id_profesor_asignatura, id_aula, id_grupo, dia, hora) FROM STDIN",
+            buf
+        )
+    finally:
+        cur.close()
     
-    return data
\ No newline at end of file
+    return len(rows)
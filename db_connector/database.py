@@ -1,7 +1,10 @@
-from sqlalchemy import create_engine
+import logging
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from config import DATABASE_URL
 
+log = logging.getLogger(__name__)
+
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -10,4 +13,30 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def ensure_indexes():
+    """
+    Crea (si faltan) los índices que usa el servicio. Se lanza al arrancar en un hilo
+    aparte, fuera del camino de las peticiones; CONCURRENTLY no bloquea escrituras y
+    requiere AUTOCOMMIT porque no puede correr dentro de una transacción.
+    Un CREATE INDEX CONCURRENTLY interrumpido deja el índice INVALID y IF NOT EXISTS
+    lo saltaría para siempre: en ese caso se elimina y se vuelve a crear.
+    """
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            # DELETE FROM horario_clases WHERE id_grupo = ANY(...) en /generate
+            is_valid = conn.execute(text(
+                "SELECT indisvalid FROM pg_index "
+                "WHERE indexrelid = to_regclass('idx_horario_clases_id_grupo')"
+            )).scalar()
+            if is_valid is False:
+                log.warning("⚠️ Índice idx_horario_clases_id_grupo inválido (creación interrumpida), recreándolo")
+                conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS idx_horario_clases_id_grupo"))
+            conn.execute(text(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_horario_clases_id_grupo "
+                "ON horario_clases (id_grupo)"
+            ))
+    except Exception as e:
+        log.warning(f"⚠️ No se pudieron crear los índices: {e}")
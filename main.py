@@ -1,14 +1,29 @@
+import logging
+import threading
+from contextlib import asynccontextmanager
 from sqlalchemy import text
 from fastapi import FastAPI, Depends, HTTPException
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware 
-from db_connector.database import get_db 
-from db_connector.data_access import fetch_all_data_for_solver
+from db_connector.database import get_db, ensure_indexes
+from db_connector.data_access import fetch_solver_fingerprint, fetch_solver_data_cached, copy_schedule_rows
 from solver_service.scheduler import generate_schedule_for_all_groups, ScheduleResult
+from config import LOG_LEVEL
 
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="Solver Service")
+logging.basicConfig(level=LOG_LEVEL)
+log = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # En segundo plano: CONCURRENTLY espera a las transacciones abiertas y no debe frenar el arranque
+    threading.Thread(target=ensure_indexes, name="ensure-indexes", daemon=True).start()
+    yield
+
+
+app = FastAPI(title="Solver Service", lifespan=lifespan)
 
 origins = [
     "https://cronos-school.up.railway.app"
@@ -25,7 +40,7 @@ app.add_middleware(
 
 
 @app.post("/generate")
-async def generate_schedule_endpoint(
+def generate_schedule_endpoint(
     db: Session = Depends(get_db) 
 ):
     """
@@ -39,31 +54,19 @@ async def generate_schedule_endpoint(
     """
     try:
         # ============================================
-        # 1. CARGAR DATOS
+        # 0. VERIFICACIÓN PREVIA (antes de cargar todo)
         # ============================================
-        data = fetch_all_data_for_solver(db)
-        
-        print("\n" + "="*60)
-        print("--- INICIANDO GENERACIÓN DE HORARIOS ---")
-        print(f"Cursos: {len(data['courses'])}")
-        print(f"Aulas: {len(data['rooms'])}")
-        print(f"Slots: {len(data['timeslots'])}")
-        print(f"Profesores: {len(data['professors'])}")
-        print(f"Grupos: {len(data.get('groups', []))}")
-        print(f"Asignaciones profesor-materia-grupo: {len(data.get('professor_course_group_assignments', []))}")
-        print(f"Aulas asignadas a profesores: {len(data.get('professor_rooms', {}))}")
-        print("="*60 + "\n")
+        n_assignments, n_groups = db.execute(text("""
+            SELECT 
+                (SELECT COUNT(*) FROM profesor_asignatura_grupo),
+                (SELECT COUNT(*) FROM grupo)
+        """)).fetchone()
         
-        # ============================================
-        # 2. VALIDACIONES
-        # ============================================
-        
-        # Verificar asignaciones profesor-materia-grupo
-        if not data.get('professor_course_group_assignments'):
-            print("⚠️ ADVERTENCIA CRÍTICA: No hay asignaciones profesor-materia-grupo")
-            print("   El sistema necesita datos en la tabla 'profesor_asignatura_grupo'")
-            print("\n   Ejecuta este SQL para crear asignaciones:\n")
-            print("""
+        if n_assignments == 0:
+            log.warning("⚠️ ADVERTENCIA CRÍTICA: No hay asignaciones profesor-materia-grupo")
+            log.warning("   El sistema necesita datos en la tabla 'profesor_asignatura_grupo'")
+            log.warning("\n   Ejecuta este SQL para crear asignaciones:\n")
+            log.warning("""
             INSERT INTO profesor_asignatura_grupo (id_profesor_asignatura, id_grupo)
             SELECT pa.id, g.id
             FROM profesor_asignatura pa
@@ -79,12 +82,47 @@ async def generate_schedule_endpoint(
                 detail="No hay asignaciones profesor-materia-grupo. Verifica la tabla 'profesor_asignatura_grupo'."
             )
         
+        if n_groups == 0:
+            raise HTTPException(
+                status_code=400, 
+                detail="No se encontraron grupos en la base de datos"
+            )
+        
+        # ============================================
+        # 1. CARGAR DATOS
+        # ============================================
+        # La huella (un recorrido por tabla) solo se calcula si la verificación pasó
+        data = fetch_solver_data_cached(fetch_solver_fingerprint(db))
+        
+        log.info("\n" + "="*60)
+        log.info("--- INICIANDO GENERACIÓN DE HORARIOS ---")
+        log.info(f"Cursos: {len(data['courses'])}")
+        log.info(f"Aulas: {len(data['rooms'])}")
+        log.info(f"Slots: {len(data['timeslots'])}")
+        log.info(f"Profesores: {len(data['professors'])}")
+        log.info(f"Grupos: {len(data.get('groups', []))}")
+        log.info(f"Asignaciones profesor-materia-grupo: {len(data.get('professor_course_group_assignments', []))}")
+        log.info(f"Aulas asignadas a profesores: {len(data.get('professor_rooms', {}))}")
+        log.info("="*60 + "\n")
+        
+        # ============================================
+        # 2. VALIDACIONES
+        # ============================================
+        
+        # Hay filas en profesor_asignatura_grupo (verificación previa), pero el JOIN
+        # con profesor_asignatura o la carga pueden no dejar ninguna
+        if not data.get('professor_course_group_assignments'):
+            raise HTTPException(
+                status_code=400,
+                detail="No se cargaron asignaciones válidas. Verifica 'profesor_asignatura_grupo' y 'profesor_asignatura'."
+            )
+        
         # Verificar aulas de profesores
         if not data.get('professor_rooms'):
-            print("⚠️ ADVERTENCIA: No hay aulas asignadas a profesores")
-            print("   Verifica la tabla 'profesor_aula' con id_periodo = 1")
-            print("\n   Ejecuta este SQL para asignar aulas a profesores:\n")
-            print("""
+            log.warning("⚠️ ADVERTENCIA: No hay aulas asignadas a profesores")
+            log.warning("   Verifica la tabla 'profesor_aula' con id_periodo = 1")
+            log.warning("\n   Ejecuta este SQL para asignar aulas a profesores:\n")
+            log.warning("""
             INSERT INTO profesor_aula (id_profesor, id_aula, id_periodo)
             SELECT p.id, a.id, 1
             FROM profesor p
@@ -96,98 +134,98 @@ async def generate_schedule_endpoint(
                 WHERE pa.id_profesor = p.id AND pa.id_periodo = 1
             );
             """)
-            print("   ⚠️ Continuando sin aulas asignadas... esto causará errores\n")
-        
-        # Verificar grupos
-        groups_to_process = data.get('groups', [])
+            log.warning("   ⚠️ Continuando sin aulas asignadas... esto causará errores\n")
         
-        if not groups_to_process:
-            raise HTTPException(
-                status_code=400, 
-                detail="No se encontraron grupos en la base de datos"
-            )
+        # Ya hay grupos (verificación previa)
+        groups_to_process = data['groups']
 
         # ============================================
         # 3. PREPARAR MAPEOS
         # ============================================
-        professor_map = {p.id: p.name for p in data['professors']}
-        course_map = {c.id: c.name for c in data['courses']}
-        room_map = {r.id: r.name for r in data['rooms']}
-        building_map = {r.id: r.building_name or "N/A" for r in data['rooms']}
-        timeslot_map = {ts.id: (ts.day, ts.start_time) for ts in data['timeslots']}
+        # Construidos una sola vez por el loader (y reutilizados mientras dure la caché)
+        professor_map = data['professor_map']
+        course_map = data['course_map']
+        room_map = data['room_map']
+        building_map = data['building_map']
+        timeslot_map = data['timeslot_map']
+        slot_labels = data['slot_labels']
+        course_by_id = data['course_by_id']
+        assignment_by_group_course = data['assignment_by_group_course']
         
         # ============================================
-        # 4. LIMPIAR HORARIOS ANTERIORES
-        # ============================================
-        print("🗑️  Limpiando horarios anteriores...")
-        group_ids_str = ','.join([str(g.id) for g in groups_to_process])
-        db.execute(text(f"DELETE FROM horario_clases WHERE id_grupo IN ({group_ids_str})"))
-        db.commit()
-        print("✅ Horarios anteriores eliminados\n")
-        
+        # 4. GENERAR HORARIOS (NUEVA ESTRATEGIA)
         # ============================================
-        # 5. GENERAR HORARIOS (NUEVA ESTRATEGIA)
-        # ============================================
-        all_schedules = generate_schedule_for_all_groups(
+        all_schedules, summary = generate_schedule_for_all_groups(
             courses=data['courses'], 
             rooms=data['rooms'], 
             timeslots=data['timeslots'], 
             professors=data['professors'],
             assignments=data['professor_course_group_assignments'],
             professor_rooms=data.get('professor_rooms', {}),
-            groups=groups_to_process
+            groups=groups_to_process,
+            verbose=log.isEnabledFor(logging.INFO)
+        )
+        
+        # ============================================
+        # 5. LIMPIAR HORARIOS ANTERIORES
+        # ============================================
+        # Sin commit: el DELETE y el COPY viajan en la misma transacción
+        log.info("🗑️  Limpiando horarios anteriores...")
+        db.execute(
+            text("DELETE FROM horario_clases WHERE id_grupo = ANY(:ids)"),
+            {"ids": [g.id for g in groups_to_process]}
         )
+        log.info("✅ Horarios anteriores eliminados\n")
         
         # ============================================
         # 6. GUARDAR EN BASE DE DATOS
         # ============================================
-        print("\n" + "="*60)
-        print("💾 GUARDANDO HORARIOS EN BASE DE DATOS")
-        print("="*60 + "\n")
+        log.info("\n" + "="*60)
+        log.info("💾 GUARDANDO HORARIOS EN BASE DE DATOS")
+        log.info("="*60 + "\n")
         
         final_results = []
+        insert_rows = []
         
         for group in groups_to_process:
             group_id = group.id
             schedule = all_schedules.get(group_id, {})
             
             if not schedule:
-                print(f"⚠️ No se generó horario para Grupo {group_id}")
+                log.warning(f"⚠️ No se generó horario para Grupo {group_id}")
                 continue
             
-            print(f"💾 Guardando horario para {group.name}...")
+            log.info(f"💾 Guardando horario para {group.name}...")
             
             group_schedule_data = {}
             saved_count = 0
+            skipped_count = 0
             
-            for block_id, (slot_id, room_id, course_id) in schedule.items():
-                # Extraer día y hora del slot_id
-                id_dia = slot_id // 1000
-                id_hora_entera = slot_id % 1000 
+            for hour_id, (slot_id, room_id, course_id, block_key) in schedule.items():
+                # Día y hora ya decodificados en el TimeSlot
+                ts = timeslot_map[slot_id]
+                id_dia, id_hora_entera = ts.day_id, ts.hour
                 
                 # Obtener información del curso
-                course = next((c for c in data['courses'] if c.id == course_id), None)
+                course = course_by_id.get(course_id)
                 if not course:
-                    print(f"  ⚠️ Curso {course_id} no encontrado")
+                    log.debug(f"  ⚠️ Curso {course_id} no encontrado")
+                    skipped_count += 1
                     continue
                 
                 # Obtener el profesor correcto para este grupo y materia
-                assignment = next(
-                    (a for a in data['professor_course_group_assignments'] 
-                     if a.group_id == group_id and a.course_id == course_id), 
-                    None
-                )
+                assignment = assignment_by_group_course.get((group_id, course_id))
                 
                 if not assignment:
-                    print(f"  ⚠️ No se encontró asignación profesor-materia para grupo {group_id}, materia {course_id}")
+                    log.debug(f"  ⚠️ No se encontró asignación profesor-materia para grupo {group_id}, materia {course_id}")
+                    skipped_count += 1
                     continue
                 
                 id_profesor = assignment.professor_id
                 id_profesor_asignatura = assignment.professor_asignatura_id
                 
                 # Formatear para respuesta JSON
-                dia_str, hora_str_raw = timeslot_map.get(slot_id, ('Desconocido', 'Desconocida'))
-                hora_formateada = str(hora_str_raw)[:5] if hora_str_raw else '00:00'
+                dia_str, hora_formateada = slot_labels[slot_id]
                 
                 class_info = {
                     "materia": course_map.get(course_id, "Materia Desconocida"),
@@ -196,54 +234,21 @@ async def generate_schedule_endpoint(
                     "edificio": building_map.get(room_id, "N/A")
                 }
 
-                if dia_str not in group_schedule_data:
-                    group_schedule_data[dia_str] = {}
-                
-                group_schedule_data[dia_str][hora_formateada] = class_info
+                group_schedule_data.setdefault(dia_str, {})[hora_formateada] = class_info
                 
-                # Insertar en horario_clases
-                try:
-                    insert_query = text("""
-                        INSERT INTO horario_clases (
-                            id_profesor_asignatura, 
-                            id_aula, 
-                            id_grupo, 
-                            dia, 
-                            hora 
-                        ) 
-                        VALUES (
-                            :prof_asig, 
-                            :aula, 
-                            :grupo, 
-                            :dia, 
-                            :hora
-                        )
-                    """)
-                    
-                    db.execute(
-                        insert_query,
-                        {
-                            "prof_asig": id_profesor_asignatura,
-                            "aula": room_id,
-                            "grupo": group_id,
-                            "dia": id_dia,
-                            "hora": f"{id_hora_entera}:00:00"
-                        }
-                    )
-                    saved_count += 1
-                    
-                except Exception as e:
-                    print(f"  ❌ Error al insertar clase: {e}")
-                    continue
+                # Acumular fila para horario_clases
+                insert_rows.append((
+                    id_profesor_asignatura,
+                    room_id,
+                    group_id,
+                    id_dia,
+                    f"{id_hora_entera}:00:00"
+                ))
+                saved_count += 1
             
-            # Commit por grupo
-            try:
-                db.commit()
-                print(f"  ✅ {saved_count} clases guardadas para {group.name}")
-            except Exception as e:
-                db.rollback()
-                print(f"  ❌ Error al guardar grupo {group.name}: {e}")
-                continue
+            if skipped_count:
+                log.warning(f"  ⚠️ {group.name}: {skipped_count} clases omitidas sin materia o asignación")
+            log.info(f"  ✅ {saved_count} clases preparadas para {group.name}")
             
             # Agregar a resultados finales
             final_results.append({
@@ -253,15 +258,23 @@ async def generate_schedule_endpoint(
                 "data": group_schedule_data
             })
         
+        # Un solo COPY y un solo commit para todo el proceso;
+        # cualquier error cae al rollback del except externo
+        saved_total = copy_schedule_rows(db, insert_rows)
+        db.commit()
+        log.info(f"\n💾 {saved_total} clases guardadas en horario_clases")
+        
         # ============================================
         # 7. RESUMEN FINAL
         # ============================================
-        print("\n" + "="*60)
-        print("✅ PROCESO COMPLETADO")
-        print("="*60)
-        print(f"📊 Grupos procesados: {len(final_results)}/{len(groups_to_process)}")
-        print(f"💾 Horarios guardados en base de datos")
-        print("="*60 + "\n")
+        log.info("\n" + "="*60)
+        log.info("✅ PROCESO COMPLETADO")
+        log.info("="*60)
+        log.info(f"📊 Grupos procesados: {len(final_results)}/{len(groups_to_process)}")
+        if not summary.complete:
+            log.warning(f"⚠️ Horas sin asignar: {summary.total_missing} en {len(summary.per_group_missing)} grupos")
+        log.info(f"💾 Horarios guardados en base de datos")
+        log.info("="*60 + "\n")
         
         return final_results 
         
@@ -270,9 +283,7 @@ async def generate_schedule_endpoint(
         raise e
     except Exception as e:
         db.rollback()
-        print(f"\n❌ ERROR CRÍTICO: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception(f"\n❌ ERROR CRÍTICO: {e}")
         raise HTTPException(
             status_code=500, 
             detail=f"Error en generación: {str(e)}"
@@ -296,7 +307,7 @@ async def root():
 
 
 @app.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+def health_check(db: Session = Depends(get_db)):
     """Verifica el estado del servicio y la conexión a la base de datos."""
     try:
         # Verificar conexión a la base de datos
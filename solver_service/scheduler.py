@@ -1,53 +1,205 @@
+import logging
 from typing import Dict, List, Optional, Set, Tuple
-from config import ALGORITHM_VERSION, ENABLE_EVENING_RESTRICTION
-from data_service.models import Course, Room, TimeSlot, Professor, ScheduleResult, ProfessorCourseGroupAssignment
+from data_service.models import Course, Room, TimeSlot, Professor, ScheduleResult, ProfessorCourseGroupAssignment, build_slot_index
 import random
-from copy import deepcopy
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+
+log = logging.getLogger(__name__)
+
+
+_NO_DAYS = frozenset()
+
+DAY_RANK = {day: i for i, day in enumerate(['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo'])}
+
+
+def _quiet(*args, **kwargs):
+    """Sustituto del logger cuando la corrida es silenciosa."""
+
+
+def slots_to_mask(slot_index: Dict[int, int], slot_ids) -> int:
+    """Convierte una lista de slot ids en una máscara de bits (bit = índice denso del slot)."""
+    mask = 0
+    for slot_id in slot_ids:
+        mask |= 1 << slot_index[slot_id]
+    return mask
+
+
+@dataclass(frozen=True, slots=True)
+class DayBlock:
+    """Bloque de horas continuas de un día, precalculado al construir SchedulingData."""
+    start_idx: int
+    slots: Tuple[TimeSlot, ...]
+    slot_ids: Tuple[int, ...]
+    first_hour: int
+    mask: int
+    demand: int
+
+
+@dataclass(frozen=True, slots=True)
+class HourRecord:
+    """Una hora colocada en all_schedules, indexada por slot en GroupScheduleTracker.slot_to_block."""
+    group_id: int
+    hour_id: str
+    block_key: str
+    room_id: int
+    course_id: int
+
+
+@dataclass(slots=True)
+class SummaryStats:
+    """Resumen de la corrida: horas faltantes por grupo como (course_id, asignadas, semanales)."""
+    total_missing: int
+    per_group_missing: Dict[int, List[Tuple[int, int, int]]]
+    complete: bool
 
 
 class SchedulingData:
     """Clase para organizar y buscar datos rápidamente."""
     def __init__(self, courses, rooms, timeslots, professors, assignments, professor_rooms):
         self.courses = {c.id: c for c in courses}
+        self.course_is_english = {
+            c.id: ('inglés' in c.name.lower() or 'ingles' in c.name.lower()) for c in courses
+        }
         self.rooms = {r.id: r for r in rooms}
         self.professors = {p.id: p for p in professors}
         self.slots = {s.id: s for s in timeslots}
         self.professor_rooms = professor_rooms
         
-        self.professor_available_slots = {}
-        all_slot_ids = set(s.id for s in timeslots)
+        # Cada slot tiene un bit; las ocupaciones/disponibilidades son máscaras int.
+        # Mismo índice que el loader, así Professor.unavail_mask se usa tal cual.
+        self.slot_index = build_slot_index(timeslots)
+        all_slots_mask = (1 << len(self.slot_index)) - 1
         
-        for prof in professors:
-            unavailable = set(prof.availability)
-            available = all_slot_ids - unavailable
-            self.professor_available_slots[prof.id] = available
+        self.professor_avail_mask = {
+            prof.id: all_slots_mask & ~prof.unavail_mask for prof in professors
+        }
         
         self.group_course_professor = {}
         for assignment in assignments:
             key = (assignment.group_id, assignment.course_id)
             self.group_course_professor[key] = assignment.professor_id
         
-        self.room_usage = {}
+        # (grupo, materia) -> (profesor, aula, máscara de disponibilidad), invariante durante la corrida.
+        # Solo entran los pares con profesor y aula: la ausencia es el "no asignable".
+        self.gc_resolved = {}
+        for key, prof_id in self.group_course_professor.items():
+            room_id = self.professor_rooms.get(prof_id)
+            if prof_id and room_id:
+                self.gc_resolved[key] = (
+                    prof_id, room_id, self.professor_avail_mask.get(prof_id, all_slots_mask)
+                )
+        
+        self.room_mask = defaultdict(int)
         
         self.valid_slots = [
             s for s in timeslots 
-            if "17:00" <= s.start_time < "22:00" 
+            if 17 <= s.hour < 22
         ]
         
-        self.slots_by_day = {}
+        self.slots_by_day = defaultdict(list)
         for s in self.valid_slots:
-            if s.day not in self.slots_by_day:
-                self.slots_by_day[s.day] = []
             self.slots_by_day[s.day].append(s)
+        self.slots_by_day = dict(self.slots_by_day)
         
         for day in self.slots_by_day:
             self.slots_by_day[day].sort(key=lambda slot: slot.id)
+        
+        # Horas de inicio (enteras) distintas por día, en orden, y acceso directo (día, hora) -> slot
+        self.day_start_hours = {
+            day: tuple(dict.fromkeys(slot.hour for slot in day_slots))
+            for day, day_slots in self.slots_by_day.items()
+        }
+        self.slot_by_day_hour = {(s.day, s.hour): s for s in self.valid_slots}
+        
+        # Secuencias de días consecutivos por cantidad de días: {n: [[día, ...], ...]}
+        self.consecutive_sequences = {
+            n: get_consecutive_day_sequences(self.slots_by_day, n)
+            for n in range(1, len(self.slots_by_day) + 1)
+        }
+        
+        # Demanda por slot: cuántos pares (grupo, materia) tienen a su profesor disponible ahí
+        slot_demand = [0] * len(self.slot_index)
+        for _, _, prof_avail in self.gc_resolved.values():
+            while prof_avail:
+                low = prof_avail & -prof_avail
+                slot_demand[low.bit_length() - 1] += 1
+                prof_avail ^= low
+        
+        # Bloques continuos por día y duración: {día: {duración: [DayBlock, ...]}}
+        self.day_blocks = {}
+        # Si los bits de cada bloque son contiguos: {día: {duración: (bits de inicio, {bit: DayBlock})}}
+        self.day_block_starts = {}
+        for day, day_slots in self.slots_by_day.items():
+            hours = [slot.hour for slot in day_slots]
+            blocks_by_duration = {}
+            
+            for duration in range(1, len(day_slots) + 1):
+                blocks = []
+                for start_idx in range(len(day_slots) - duration + 1):
+                    end_idx = start_idx + duration
+                    if any(hours[i + 1] - hours[i] != 1 for i in range(start_idx, end_idx - 1)):
+                        continue
+                    
+                    consecutive = tuple(day_slots[start_idx:end_idx])
+                    slot_ids = tuple(slot.id for slot in consecutive)
+                    blocks.append(DayBlock(
+                        start_idx=start_idx,
+                        slots=consecutive,
+                        slot_ids=slot_ids,
+                        first_hour=consecutive[0].hour,
+                        mask=self.slots_mask(slot_ids),
+                        demand=sum(slot_demand[self.slot_index[slot_id]] for slot_id in slot_ids)
+                    ))
+                blocks_by_duration[duration] = blocks
+            
+            self.day_blocks[day] = blocks_by_duration
+            
+            starts_by_duration = {}
+            for duration, blocks in blocks_by_duration.items():
+                start_bits = 0
+                block_by_bit = {}
+                for block in blocks:
+                    bit = self.slot_index[block.slot_ids[0]]
+                    if block.mask != ((1 << duration) - 1) << bit:
+                        break
+                    start_bits |= 1 << bit
+                    block_by_bit[bit] = block
+                else:
+                    starts_by_duration[duration] = (start_bits, block_by_bit)
+            self.day_block_starts[day] = starts_by_duration
+    
+    def slots_mask(self, slot_ids: List[int]) -> int:
+        return slots_to_mask(self.slot_index, slot_ids)
+    
+    def free_day_blocks(self, day: str, duration: int, free: int) -> List[DayBlock]:
+        """Bloques del día cuyos slots están todos libres en la máscara `free`, en orden de inicio."""
+        starts = self.day_block_starts.get(day, {}).get(duration)
+        if starts is None:
+            return [b for b in self.day_blocks.get(day, {}).get(duration, ()) if (free & b.mask) == b.mask]
+        
+        # Bit i de `run` = los `duration` bits desde i están libres (todas las ventanas a la vez)
+        start_bits, block_by_bit = starts
+        run = free & start_bits
+        for k in range(1, duration):
+            run &= free >> k
+        
+        blocks = []
+        while run:
+            low = run & -run
+            blocks.append(block_by_bit[low.bit_length() - 1])
+            run ^= low
+        return blocks
     
     def is_professor_available_at_slots(self, professor_id: int, slot_ids: List[int]) -> bool:
-        if professor_id not in self.professor_available_slots:
+        avail = self.professor_avail_mask.get(professor_id)
+        if avail is None:
             return True
-        available_slots = self.professor_available_slots[professor_id]
-        return all(slot_id in available_slots for slot_id in slot_ids)
+        if len(slot_ids) == 1:
+            return bool(avail >> self.slot_index[slot_ids[0]] & 1)
+        block_mask = self.slots_mask(slot_ids)
+        return (avail & block_mask) == block_mask
     
     def get_professor_for_group_course(self, group_id: int, course_id: int) -> Optional[int]:
         return self.group_course_professor.get((group_id, course_id))
@@ -56,195 +208,400 @@ class SchedulingData:
         return self.professor_rooms.get(professor_id)
     
     def is_room_available(self, room_id: int, slot_ids: List[int]) -> bool:
-        if room_id not in self.room_usage:
-            return True
-        return all(slot_id not in self.room_usage[room_id] for slot_id in slot_ids)
+        return not (self.room_mask.get(room_id, 0) & self.slots_mask(slot_ids))
     
     def mark_room_used(self, room_id: int, slot_ids: List[int]):
-        if room_id not in self.room_usage:
-            self.room_usage[room_id] = set()
-        self.room_usage[room_id].update(slot_ids)
+        self.room_mask[room_id] |= self.slots_mask(slot_ids)
     
     def unmark_room_used(self, room_id: int, slot_ids: List[int]):
-        if room_id in self.room_usage:
-            for slot_id in slot_ids:
-                self.room_usage[room_id].discard(slot_id)
+        if room_id in self.room_mask:
+            self.room_mask[room_id] &= ~self.slots_mask(slot_ids)
 
 
-class GroupScheduleTracker:
-    """Rastrea los horarios de todos los grupos."""
+class Trail:
+    """
+    Registro de deshacer para el backtracking: cada mutación apila su inversa mientras
+    haya un checkpoint abierto, y rollback_to las aplica en orden inverso.
+    """
     def __init__(self):
-        self.prof_schedule = {}
-        self.group_schedule = {}
+        self._undo = []
+        self._depth = 0
+    
+    def push(self, undo_fn):
+        if self._depth > 0:
+            self._undo.append(undo_fn)
+    
+    @property
+    def recording(self) -> bool:
+        return self._depth > 0
+    
+    def set_item(self, mapping, key, value):
+        if self._depth > 0:
+            if key in mapping:
+                previous = mapping[key]
+                self._undo.append(lambda: mapping.__setitem__(key, previous))
+            else:
+                self._undo.append(lambda: mapping.pop(key, None))
+        mapping[key] = value
+    
+    def pop_item(self, mapping, key):
+        if key not in mapping:
+            return None
+        value = mapping.pop(key)
+        self.push(lambda: mapping.__setitem__(key, value))
+        return value
+    
+    def checkpoint(self) -> int:
+        self._depth += 1
+        return len(self._undo)
+    
+    def rollback_to(self, mark: int):
+        # Las inversas no se registran a sí mismas mientras se reproducen
+        depth, self._depth = self._depth, 0
+        while len(self._undo) > mark:
+            self._undo.pop()()
+        self._depth = depth - 1
+    
+    def release(self, mark: int):
+        """Confirma los cambios desde mark; si hay un checkpoint exterior, siguen siendo deshacibles."""
+        self._depth -= 1
+        if not self._depth:
+            del self._undo[mark:]
+
+
+class GroupScheduleTracker:
+    """Rastrea los horarios de todos los grupos (ocupación como máscaras de bits por slot)."""
+    def __init__(self, slot_index: Dict[int, int], seed: Optional[int] = None, verbose: bool = False):
+        self.slot_index = slot_index
+        # PRNG propio de la corrida: con la misma semilla el resultado es reproducible
+        self.rng = random.Random(seed)
+        # Salida de progreso: sin E/S en el camino caliente salvo que se pida. Los mensajes
+        # usan argumentos %-style, así en modo silencioso no se formatea nada
+        self.verbose = verbose
+        self.log = log.info if verbose else _quiet
+        self.prof_mask = defaultdict(int)
+        self.group_mask = defaultdict(int)
         self.course_fixed_hour = {}
-        self.group_course_days = {}
+        # Horas fijas de inglés en uso (con cuántos cursos las usan), mantenidas en cada cambio
+        self._english_hours: Set[int] = set()
+        self._english_hour_refs: Dict[int, int] = defaultdict(int)
+        self.group_course_days = defaultdict(set)
+        # Índice inverso: slot_id -> {(group_id, hour_id): HourRecord}
+        self.slot_to_block = defaultdict(dict)
+        self._hour_slot = {}  # (group_id, hour_id) -> slot_id
+        # Horas asignadas por (group_id, course_id), al día con cada assign/unassign
+        self.course_hours: Dict[Tuple[int, int], int] = defaultdict(int)
+        self.trail = Trail()
+        self._block_counter = 0
     
     def can_assign_professor(self, prof_id: int, slot_ids: List[int]) -> bool:
-        if prof_id not in self.prof_schedule:
-            return True
-        return all(slot_id not in self.prof_schedule[prof_id] for slot_id in slot_ids)
+        return not (self.prof_mask.get(prof_id, 0) & slots_to_mask(self.slot_index, slot_ids))
     
     def can_assign_group(self, group_id: int, slot_ids: List[int]) -> bool:
-        if group_id not in self.group_schedule:
-            return True
-        return all(slot_id not in self.group_schedule[group_id] for slot_id in slot_ids)
+        return not (self.group_mask.get(group_id, 0) & slots_to_mask(self.slot_index, slot_ids))
     
     def get_used_days_for_course(self, group_id: int, course_id: int) -> Set[str]:
-        return self.group_course_days.get((group_id, course_id), set())
+        # .get para no crear entradas vacías en las consultas
+        return self.group_course_days.get((group_id, course_id), _NO_DAYS)
     
     def add_day_for_course(self, group_id: int, course_id: int, day: str):
-        key = (group_id, course_id)
-        if key not in self.group_course_days:
-            self.group_course_days[key] = set()
-        self.group_course_days[key].add(day)
+        days = self.group_course_days[(group_id, course_id)]
+        if day not in days:
+            days.add(day)
+            self.trail.push(lambda: days.discard(day))
     
     def remove_day_for_course(self, group_id: int, course_id: int, day: str):
-        key = (group_id, course_id)
-        if key in self.group_course_days:
-            self.group_course_days[key].discard(day)
+        days = self.group_course_days.get((group_id, course_id))
+        if days and day in days:
+            days.discard(day)
+            self.trail.push(lambda: days.add(day))
     
-    def get_fixed_hour_for_course(self, group_id: int, course_id: int) -> Optional[str]:
+    def get_fixed_hour_for_course(self, group_id: int, course_id: int) -> Optional[int]:
         return self.course_fixed_hour.get((group_id, course_id))
     
-    def set_fixed_hour_for_course(self, group_id: int, course_id: int, hour: str):
-        self.course_fixed_hour[(group_id, course_id)] = hour
-    
-    def get_used_hours_for_english(self) -> Set[str]:
-        return set(self.course_fixed_hour.values())
-    
-    def assign(self, prof_id: int, group_id: int, slot_ids: List[int], course_id: int):
-        if prof_id not in self.prof_schedule:
-            self.prof_schedule[prof_id] = {}
-        if group_id not in self.group_schedule:
-            self.group_schedule[group_id] = {}
+    def set_fixed_hour_for_course(self, group_id: int, course_id: int, hour: int):
+        key = (group_id, course_id)
+        previous = self.course_fixed_hour.get(key)
+        if previous is not None:
+            self._release_english_hour(previous)
+        self.course_fixed_hour[key] = hour
+        self._english_hour_refs[hour] += 1
+        self._english_hours.add(hour)
         
-        for slot_id in slot_ids:
-            self.prof_schedule[prof_id][slot_id] = group_id
-            self.group_schedule[group_id][slot_id] = course_id
+        if previous is None:
+            self.trail.push(lambda: self.unset_fixed_hour_for_course(group_id, course_id))
+        else:
+            self.trail.push(lambda: self.set_fixed_hour_for_course(group_id, course_id, previous))
+    
+    def unset_fixed_hour_for_course(self, group_id: int, course_id: int):
+        previous = self.course_fixed_hour.pop((group_id, course_id), None)
+        if previous is None:
+            return
+        self._release_english_hour(previous)
+        self.trail.push(lambda: self.set_fixed_hour_for_course(group_id, course_id, previous))
+    
+    def _release_english_hour(self, hour: int):
+        refs = self._english_hour_refs[hour] - 1
+        if refs:
+            self._english_hour_refs[hour] = refs
+        else:
+            del self._english_hour_refs[hour]
+            self._english_hours.discard(hour)
+    
+    def get_used_hours_for_english(self) -> Set[int]:
+        """Vista en vivo de las horas fijas de inglés; no modificar."""
+        return self._english_hours
+    
+    def next_block_id(self, group_id: int, course_id: int) -> str:
+        """Id de bloque único en la corrida (las horas son f"{block_id}_H{j}")."""
+        self._block_counter += 1
+        return f"G{group_id}_C{course_id}_B{self._block_counter}"
+    
+    def _save_masks(self, prof_id: int, group_id: int):
+        if not self.trail.recording:
+            return
+        prof_prev = self.prof_mask.get(prof_id, 0)
+        group_prev = self.group_mask.get(group_id, 0)
+        
+        def restore():
+            self.prof_mask[prof_id] = prof_prev
+            self.group_mask[group_id] = group_prev
+        self.trail.push(restore)
+    
+    def _put_hour(self, slot_id: int, record: HourRecord):
+        key = (record.group_id, record.hour_id)
+        self._hour_slot[key] = slot_id
+        self.slot_to_block[slot_id][key] = record
+    
+    def _drop_hour(self, slot_id: int, key) -> HourRecord:
+        del self._hour_slot[key]
+        return self.slot_to_block[slot_id].pop(key)
+    
+    def _add_course_hours(self, key: Tuple[int, int], n: int):
+        self.course_hours[key] += n
+        self.trail.push(lambda: self.course_hours.__setitem__(key, self.course_hours[key] - n))
+    
+    def assign(
+        self, prof_id: int, group_id: int, slot_ids: List[int], course_id: int,
+        room_id: int, block_key: str, hour_ids: List[str]
+    ):
+        self._save_masks(prof_id, group_id)
+        block_mask = slots_to_mask(self.slot_index, slot_ids)
+        self.prof_mask[prof_id] |= block_mask
+        self.group_mask[group_id] |= block_mask
+        
+        for slot_id, hour_id in zip(slot_ids, hour_ids):
+            self._put_hour(slot_id, HourRecord(group_id, hour_id, block_key, room_id, course_id))
+            self.trail.push(lambda slot_id=slot_id, key=(group_id, hour_id): self._drop_hour(slot_id, key))
+        self._add_course_hours((group_id, course_id), len(slot_ids))
     
     def unassign(self, prof_id: int, group_id: int, slot_ids: List[int]):
-        if prof_id in self.prof_schedule:
-            for slot_id in slot_ids:
-                self.prof_schedule[prof_id].pop(slot_id, None)
-        if group_id in self.group_schedule:
-            for slot_id in slot_ids:
-                self.group_schedule[group_id].pop(slot_id, None)
+        self._save_masks(prof_id, group_id)
+        block_mask = slots_to_mask(self.slot_index, slot_ids)
+        if prof_id in self.prof_mask:
+            self.prof_mask[prof_id] &= ~block_mask
+        if group_id in self.group_mask:
+            self.group_mask[group_id] &= ~block_mask
+        
+        for slot_id in slot_ids:
+            hours_at_slot = self.slot_to_block.get(slot_id)
+            if not hours_at_slot:
+                continue
+            for key in [k for k in hours_at_slot if k[0] == group_id]:
+                record = self._drop_hour(slot_id, key)
+                self.trail.push(lambda slot_id=slot_id, record=record: self._put_hour(slot_id, record))
+                self._add_course_hours((group_id, record.course_id), -1)
 
 
-def calculate_course_blocks(course: Course) -> List[int]:
+def calculate_course_blocks(course: Course) -> Tuple[int, ...]:
+    return _course_blocks(course.weekly_hours, course.max_block_duration, course.min_block_duration)
+
+
+@lru_cache(maxsize=None)
+def _course_blocks(weekly_hours: int, max_block: int, min_block: int) -> Tuple[int, ...]:
+    # Memoizado por los atributos que determinan la partición; tupla para que el resultado compartido sea inmutable
     blocks = []
-    remaining = course.weekly_hours
+    remaining = weekly_hours
     
     while remaining > 0:
-        block_dur = min(remaining, course.max_block_duration)
-        if block_dur < course.min_block_duration and remaining >= course.min_block_duration:
-            block_dur = course.min_block_duration
+        block_dur = min(remaining, max_block)
+        if block_dur < min_block and remaining >= min_block:
+            block_dur = min_block
         blocks.append(block_dur)
         remaining -= block_dur
     
-    return blocks
+    return tuple(blocks)
+
+
+@lru_cache(maxsize=None)
+def unit_blocks(n: int) -> Tuple[int, ...]:
+    """n bloques de 1h (reintentos de la segunda pasada), compartidos entre llamadas."""
+    return (1,) * n
+
+
+def free_slots_mask(group_id, resolved, data, global_tracker) -> int:
+    """Slots disponibles para el profesor y sin ocupar por profesor, grupo ni aula."""
+    prof_id, room_id, prof_avail = resolved
+    return prof_avail & ~(
+        global_tracker.prof_mask.get(prof_id, 0)
+        | global_tracker.group_mask.get(group_id, 0)
+        | data.room_mask.get(room_id, 0)
+    )
+
+
+def count_feasible_positions(course, group_id, duration, data, global_tracker, is_english, fixed_hour) -> Dict[str, int]:
+    """Cuántas posiciones libres (sin desplazar nada) tiene el bloque en cada día."""
+    resolved = data.gc_resolved.get((group_id, course.id))
+    if resolved is None:
+        return dict.fromkeys(data.slots_by_day, 0)
+    
+    free = free_slots_mask(group_id, resolved, data, global_tracker)
+    used_days = global_tracker.get_used_days_for_course(group_id, course.id) if course.max_block_duration == 1 else ()
+    
+    domain = {}
+    for day in data.slots_by_day:
+        if day in used_days:
+            domain[day] = 0
+        elif is_english and fixed_hour is not None:
+            domain[day] = sum(1 for b in data.free_day_blocks(day, duration, free) if b.first_hour == fixed_hour)
+        else:
+            domain[day] = len(data.free_day_blocks(day, duration, free))
+    return domain
 
 
 def find_all_valid_positions(course, group_id, duration, day, data, global_tracker, is_english, fixed_hour):
     """Encuentra TODAS las posiciones válidas para un bloque en un día."""
     positions = []
     
-    prof_id = data.get_professor_for_group_course(group_id, course.id)
-    if not prof_id:
+    resolved = data.gc_resolved.get((group_id, course.id))
+    if resolved is None or day not in data.day_blocks:
         return positions
+    prof_id, room_id, _ = resolved
+    free = free_slots_mask(group_id, resolved, data, global_tracker)
     
-    room_id = data.get_professor_room(prof_id)
-    if not room_id:
-        return positions
-    
-    if day not in data.slots_by_day:
-        return positions
-    
-    day_slots = data.slots_by_day[day]
-    
-    for start_idx in range(len(day_slots) - duration + 1):
-        consecutive = day_slots[start_idx:start_idx + duration]
-        
-        is_continuous = True
-        for j in range(len(consecutive) - 1):
-            h1 = int(consecutive[j].start_time.split(':')[0])
-            h2 = int(consecutive[j + 1].start_time.split(':')[0])
-            if h2 - h1 != 1:
-                is_continuous = False
-                break
-        
-        if not is_continuous:
-            continue
-        
-        first_hour = consecutive[0].start_time
-        slot_ids = [s.id for s in consecutive]
-        
-        if not data.is_professor_available_at_slots(prof_id, slot_ids):
-            continue
-        
-        if is_english and fixed_hour and first_hour != fixed_hour:
+    for block in data.free_day_blocks(day, duration, free):
+        if is_english and fixed_hour is not None and block.first_hour != fixed_hour:
             continue
         
-        if not global_tracker.can_assign_professor(prof_id, slot_ids):
-            continue
-        
-        if not global_tracker.can_assign_group(group_id, slot_ids):
+        positions.append(make_position(day, block, room_id, prof_id))
+    
+    return positions
+
+
+def find_all_positions_with_conflicts(course, group_id, duration, day, data, global_tracker, is_english, fixed_hour):
+    """
+    Todas las posiciones del día que el profesor puede dar, cada una con los bloques que la ocupan
+    (lista vacía si está libre). Ordenadas por cantidad de conflictos y luego de conflictos de inglés.
+    """
+    resolved = data.gc_resolved.get((group_id, course.id))
+    if resolved is None:
+        return []
+    prof_id, room_id, prof_avail = resolved
+    free = free_slots_mask(group_id, resolved, data, global_tracker)
+    
+    results = []
+    for block in data.day_blocks.get(day, {}).get(duration, ()):
+        if (prof_avail & block.mask) != block.mask:
             continue
         
-        if not data.is_room_available(room_id, slot_ids):
+        if is_english and fixed_hour is not None and block.first_hour != fixed_hour:
             continue
         
-        positions.append({
-            'day': day,
-            'start_idx': start_idx,
-            'slots': consecutive,
-            'slot_ids': slot_ids,
-            'first_hour': first_hour,
-            'room_id': room_id,
-            'prof_id': prof_id
-        })
+        if (free & block.mask) == block.mask:
+            conflicts = []
+        else:
+            conflicts = get_conflicting_blocks(
+                block.slot_ids, group_id, data, global_tracker, prof_id, room_id
+            )
+        results.append((make_position(day, block, room_id, prof_id), conflicts))
     
-    return positions
+    results.sort(key=lambda r: (len(r[1]), sum(1 for c in r[1] if c['is_english'])))
+    return results
 
 
-def get_conflicting_blocks(slot_ids, group_id, all_schedules, data, global_tracker):
-    """Identifica qué bloques están causando conflicto en los slots dados."""
-    conflicts = []
+def make_position(day, block, room_id, prof_id):
+    return {
+        'day': day,
+        'start_idx': block.start_idx,
+        'slots': block.slots,
+        'slot_ids': block.slot_ids,
+        'first_hour': block.first_hour,
+        'demand': block.demand,
+        'room_id': room_id,
+        'prof_id': prof_id
+    }
+
+
+def commit_block(pos, course, group_id, data, global_tracker, all_schedules) -> str:
+    """
+    Registra un bloque colocado: horas en all_schedules, ocupación en el tracker,
+    aula y día de la materia. Todo queda en el trail para poder deshacerlo.
+    """
+    trail = global_tracker.trail
+    schedule = all_schedules[group_id]
+    slot_ids, room_id = pos['slot_ids'], pos['room_id']
     
-    for other_group_id, schedule in all_schedules.items():
-        blocks_in_group = {}
-        
-        for hour_id, (slot_id, room_id, course_id) in schedule.items():
-            if slot_id in slot_ids:
-                parts = hour_id.split('_')
-                if len(parts) >= 3:
-                    block_key = f"{parts[0]}_{parts[1]}_{parts[2]}"
-                    if block_key not in blocks_in_group:
-                        blocks_in_group[block_key] = {
-                            'group_id': other_group_id,
-                            'course_id': course_id,
-                            'hours': []
-                        }
-                    blocks_in_group[block_key]['hours'].append({
-                        'hour_id': hour_id,
-                        'slot_id': slot_id,
-                        'room_id': room_id
-                    })
-        
-        for block_key, block_info in blocks_in_group.items():
-            course = data.courses.get(block_info['course_id'])
-            is_english = course and ('inglés' in course.name.lower() or 'ingles' in course.name.lower())
-            
-            conflicts.append({
-                'block_key': block_key,
-                'group_id': block_info['group_id'],
-                'course_id': block_info['course_id'],
-                'course': course,
-                'is_english': is_english,
-                'hours': block_info['hours'],
-                'all_slot_ids': [h['slot_id'] for h in block_info['hours']]
+    block_id = global_tracker.next_block_id(group_id, course.id)
+    hour_ids = []
+    for j, slot_id in enumerate(slot_ids):
+        hour_id = f"{block_id}_H{j}"
+        trail.set_item(schedule, hour_id, (slot_id, room_id, course.id, block_id))
+        hour_ids.append(hour_id)
+    
+    global_tracker.assign(pos['prof_id'], group_id, slot_ids, course.id, room_id, block_id, hour_ids)
+    data.mark_room_used(room_id, slot_ids)
+    trail.push(lambda: data.unmark_room_used(room_id, slot_ids))
+    
+    if course.max_block_duration == 1:
+        global_tracker.add_day_for_course(group_id, course.id, pos['day'])
+    
+    return block_id
+
+
+def get_conflicting_blocks(slot_ids, group_id, data, global_tracker, prof_id=None, room_id=None):
+    """
+    Identifica qué bloques están causando conflicto en los slots dados.
+    Con prof_id/room_id solo cuenta los que bloquean de verdad: mismo grupo, profesor o aula.
+    """
+    blocks = {}
+    
+    # Índice inverso slot -> horas colocadas: solo se visitan los slots pedidos
+    for slot_id in slot_ids:
+        for record in global_tracker.slot_to_block.get(slot_id, {}).values():
+            if prof_id is not None and not (
+                record.group_id == group_id
+                or record.room_id == room_id
+                or data.group_course_professor.get((record.group_id, record.course_id)) == prof_id
+            ):
+                continue
+            block_info = blocks.get(record.block_key)
+            if block_info is None:
+                block_info = blocks[record.block_key] = {
+                    'group_id': record.group_id,
+                    'course_id': record.course_id,
+                    'hours': []
+                }
+            block_info['hours'].append({
+                'hour_id': record.hour_id,
+                'slot_id': slot_id,
+                'room_id': record.room_id
             })
     
+    conflicts = []
+    for block_key, block_info in blocks.items():
+        course = data.courses.get(block_info['course_id'])
+        is_english = data.course_is_english.get(block_info['course_id'], False)
+        
+        conflicts.append({
+            'block_key': block_key,
+            'group_id': block_info['group_id'],
+            'course_id': block_info['course_id'],
+            'course': course,
+            'is_english': is_english,
+            'hours': block_info['hours'],
+            'all_slot_ids': [h['slot_id'] for h in block_info['hours']]
+        })
+    
     return conflicts
 
 
@@ -259,34 +616,34 @@ def try_relocate_block(conflict, data, global_tracker, all_schedules):
     if not course:
         return False
     
-    prof_id = data.get_professor_for_group_course(group_id, course_id)
-    if not prof_id:
+    resolved = data.gc_resolved.get((group_id, course_id))
+    if resolved is None:
         return False
-    
-    room_id = data.get_professor_room(prof_id)
+    prof_id = resolved[0]
     
     old_slot_ids = [h['slot_id'] for h in hours]
-    old_day = None
-    for s in data.valid_slots:
-        if s.id == old_slot_ids[0]:
-            old_day = s.day
-            break
+    old_room_id = hours[0]['room_id']
+    old_day = data.slots[old_slot_ids[0]].day
+    
+    trail = global_tracker.trail
+    mark = trail.checkpoint()
+    schedule = all_schedules[group_id]
     
     for h in hours:
-        if h['hour_id'] in all_schedules[group_id]:
-            del all_schedules[group_id][h['hour_id']]
+        trail.pop_item(schedule, h['hour_id'])
     
     global_tracker.unassign(prof_id, group_id, old_slot_ids)
-    data.unmark_room_used(hours[0]['room_id'], old_slot_ids)
+    data.unmark_room_used(old_room_id, old_slot_ids)
+    trail.push(lambda: data.mark_room_used(old_room_id, old_slot_ids))
     
-    if old_day and course.max_block_duration == 1:
+    if course.max_block_duration == 1:
         global_tracker.remove_day_for_course(group_id, course_id, old_day)
     
     is_english = conflict['is_english']
     fixed_hour = global_tracker.get_fixed_hour_for_course(group_id, course_id) if is_english else None
     
-    days = list(data.slots_by_day.keys())
-    random.shuffle(days)
+    days = list(data.slots_by_day)
+    global_tracker.rng.shuffle(days)
     
     for day in days:
         if course.max_block_duration == 1:
@@ -299,30 +656,12 @@ def try_relocate_block(conflict, data, global_tracker, all_schedules):
         )
         
         if positions:
-            pos = random.choice(positions)
-            
-            new_block_id = f"G{group_id}_C{course_id}_B{random.randint(1000,9999)}"
-            for j, slot_id in enumerate(pos['slot_ids']):
-                hour_id = f"{new_block_id}_H{j}"
-                all_schedules[group_id][hour_id] = (slot_id, pos['room_id'], course_id)
-            
-            global_tracker.assign(pos['prof_id'], group_id, pos['slot_ids'], course_id)
-            data.mark_room_used(pos['room_id'], pos['slot_ids'])
-            
-            if course.max_block_duration == 1:
-                global_tracker.add_day_for_course(group_id, course_id, day)
-            
+            pos = positions[global_tracker.rng.randrange(len(positions))]
+            commit_block(pos, course, group_id, data, global_tracker, all_schedules)
+            trail.release(mark)
             return True
     
-    for h in hours:
-        all_schedules[group_id][h['hour_id']] = (h['slot_id'], h['room_id'], course_id)
-    
-    global_tracker.assign(prof_id, group_id, old_slot_ids, course_id)
-    data.mark_room_used(hours[0]['room_id'], old_slot_ids)
-    
-    if old_day and course.max_block_duration == 1:
-        global_tracker.add_day_for_course(group_id, course_id, old_day)
-    
+    trail.rollback_to(mark)
     return False
 
 
@@ -331,18 +670,14 @@ def get_consecutive_day_sequences(days_list, num_days):
     Genera secuencias de días consecutivos.
     Ej: si num_days=4, devuelve [['Lunes','Martes','Miércoles','Jueves'], ['Martes','Miércoles','Jueves','Viernes']]
     """
-    day_order = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-    available_days = [d for d in day_order if d in days_list]
-    
-    sequences = []
-    for i in range(len(available_days) - num_days + 1):
-        seq = available_days[i:i + num_days]
-        indices = [day_order.index(d) for d in seq]
-        is_consecutive = all(indices[j+1] - indices[j] == 1 for j in range(len(indices)-1))
-        if is_consecutive:
-            sequences.append(seq)
-    
-    return sequences
+    available_days = sorted((d for d in days_list if d in DAY_RANK), key=DAY_RANK.get)
+    ranks = [DAY_RANK[d] for d in available_days]
+    
+    return [
+        available_days[i:i + num_days]
+        for i in range(len(available_days) - num_days + 1)
+        if ranks[i + num_days - 1] - ranks[i] == num_days - 1
+    ]
 
 
 def assign_english_consecutive_days(
@@ -354,47 +689,36 @@ def assign_english_consecutive_days(
     Ej: 4 bloques -> Lun-Mar-Mié-Jue o Mar-Mié-Jue-Vie
     """
     
-    prof_id = data.get_professor_for_group_course(group_id, course.id)
-    room_id = data.get_professor_room(prof_id)
+    prof_id, room_id, _ = data.gc_resolved[(group_id, course.id)]
     num_blocks = len(block_durations)
     
-    print(f"    🇬🇧 Inglés: buscando {num_blocks} días CONSECUTIVOS...")
+    global_tracker.log("    🇬🇧 Inglés: buscando %s días CONSECUTIVOS...", num_blocks)
     
-    available_days = list(data.slots_by_day.keys())
-    sequences = get_consecutive_day_sequences(available_days, num_blocks)
+    sequences = list(data.consecutive_sequences.get(num_blocks, ()))
     
     if not sequences:
-        print(f"    ❌ No hay {num_blocks} días consecutivos disponibles")
+        global_tracker.log("    ❌ No hay %s días consecutivos disponibles", num_blocks)
         return False
     
-    random.shuffle(sequences)
+    global_tracker.rng.shuffle(sequences)
+    
+    # Horas candidatas por secuencia (unión de las horas de sus días), armadas una sola vez
+    seq_hours = [
+        (seq, [fixed_hour] if fixed_hour is not None else sorted({hour for day in seq for hour in data.day_start_hours[day]}))
+        for seq in sequences
+    ]
     
     for attempt in range(max_attempts):
-        for seq in sequences:
-            hours_to_try = set()
-            
-            for day in seq:
-                for slot in data.slots_by_day[day]:
-                    hours_to_try.add(slot.start_time)
-            
-            hours_to_try = list(hours_to_try)
-            random.shuffle(hours_to_try)
-            
-            if fixed_hour:
-                hours_to_try = [fixed_hour]
+        for seq, hours_to_try in seq_hours:
+            if fixed_hour is None:
+                global_tracker.rng.shuffle(hours_to_try)
             
             for hour in hours_to_try:
                 all_valid = True
                 positions = []
                 
                 for day in seq:
-                    day_slots = data.slots_by_day[day]
-                    slot_at_hour = None
-                    
-                    for slot in day_slots:
-                        if slot.start_time == hour:
-                            slot_at_hour = slot
-                            break
+                    slot_at_hour = data.slot_by_day_hour.get((day, hour))
                     
                     if not slot_at_hour:
                         all_valid = False
@@ -420,43 +744,31 @@ def assign_english_consecutive_days(
                     
                     positions.append({
                         'day': day,
-                        'slot': slot_at_hour,
                         'slot_ids': slot_ids,
-                        'hour': hour
+                        'hour': hour,
+                        'room_id': room_id,
+                        'prof_id': prof_id
                     })
                 
                 if all_valid and len(positions) == num_blocks:
-                    for block_num, pos in enumerate(positions, 1):
-                        block_id = f"G{group_id}_C{course.id}_B{block_num}"
-                        hour_id = f"{block_id}_H0"
-                        
-                        all_schedules[group_id][hour_id] = (pos['slot'].id, room_id, course.id)
-                        global_tracker.assign(prof_id, group_id, pos['slot_ids'], course.id)
-                        data.mark_room_used(room_id, pos['slot_ids'])
-                        global_tracker.add_day_for_course(group_id, course.id, pos['day'])
+                    for pos in positions:
+                        commit_block(pos, course, group_id, data, global_tracker, all_schedules)
                     
-                    if not fixed_hour:
+                    if fixed_hour is None:
                         global_tracker.set_fixed_hour_for_course(group_id, course.id, hour)
                     
-                    print(f"    ✅ Inglés asignado: {' → '.join(seq)} a las {hour}")
+                    if global_tracker.verbose:
+                        global_tracker.log("    ✅ Inglés asignado: %s a las %02d:00", ' → '.join(seq), hour)
                     return True
         
         # Intentar desplazar bloques no-inglés
-        for seq in sequences:
-            target_hours = [fixed_hour] if fixed_hour else list(hours_to_try)
-            
+        for seq, target_hours in seq_hours:
             for hour in target_hours:
                 conflicts_to_move = []
                 can_potentially_work = True
                 
                 for day in seq:
-                    day_slots = data.slots_by_day[day]
-                    slot_at_hour = None
-                    
-                    for slot in day_slots:
-                        if slot.start_time == hour:
-                            slot_at_hour = slot
-                            break
+                    slot_at_hour = data.slot_by_day_hour.get((day, hour))
                     
                     if not slot_at_hour:
                         can_potentially_work = False
@@ -467,7 +779,7 @@ def assign_english_consecutive_days(
                         break
                     
                     conflicts = get_conflicting_blocks(
-                        [slot_at_hour.id], group_id, all_schedules, data, global_tracker
+                        [slot_at_hour.id], group_id, data, global_tracker
                     )
                     
                     for c in conflicts:
@@ -480,28 +792,19 @@ def assign_english_consecutive_days(
                         break
                 
                 if can_potentially_work and conflicts_to_move:
-                    all_moved = True
-                    moved = []
-                    
-                    for conflict in conflicts_to_move:
-                        if try_relocate_block(conflict, data, global_tracker, all_schedules):
-                            moved.append(conflict)
-                        else:
-                            all_moved = False
-                            break
+                    # Si no se logra colocar inglés, se deshacen los desplazamientos
+                    mark = global_tracker.trail.checkpoint()
+                    all_moved = all(
+                        try_relocate_block(conflict, data, global_tracker, all_schedules)
+                        for conflict in conflicts_to_move
+                    )
                     
                     if all_moved:
                         positions = []
                         all_valid = True
                         
                         for day in seq:
-                            day_slots = data.slots_by_day[day]
-                            slot_at_hour = None
-                            
-                            for slot in day_slots:
-                                if slot.start_time == hour:
-                                    slot_at_hour = slot
-                                    break
+                            slot_at_hour = data.slot_by_day_hour.get((day, hour))
                             
                             if not slot_at_hour:
                                 all_valid = False
@@ -521,188 +824,163 @@ def assign_english_consecutive_days(
                             
                             positions.append({
                                 'day': day,
-                                'slot': slot_at_hour,
                                 'slot_ids': slot_ids,
-                                'hour': hour
+                                'hour': hour,
+                                'room_id': room_id,
+                                'prof_id': prof_id
                             })
                         
                         if all_valid and len(positions) == num_blocks:
-                            for block_num, pos in enumerate(positions, 1):
-                                block_id = f"G{group_id}_C{course.id}_B{block_num}"
-                                hour_id = f"{block_id}_H0"
-                                
-                                all_schedules[group_id][hour_id] = (pos['slot'].id, room_id, course.id)
-                                global_tracker.assign(prof_id, group_id, pos['slot_ids'], course.id)
-                                data.mark_room_used(room_id, pos['slot_ids'])
-                                global_tracker.add_day_for_course(group_id, course.id, pos['day'])
+                            for pos in positions:
+                                commit_block(pos, course, group_id, data, global_tracker, all_schedules)
                             
-                            if not fixed_hour:
+                            if fixed_hour is None:
                                 global_tracker.set_fixed_hour_for_course(group_id, course.id, hour)
                             
-                            print(f"    ✅ Inglés asignado (con desplazamiento): {' → '.join(seq)} a las {hour}")
+                            global_tracker.trail.release(mark)
+                            if global_tracker.verbose:
+                                global_tracker.log("    ✅ Inglés asignado (con desplazamiento): %s a las %02d:00", ' → '.join(seq), hour)
                             return True
+                    
+                    global_tracker.trail.rollback_to(mark)
     
-    print(f"    ❌ No se pudo asignar inglés en días consecutivos para {group_name}")
+    global_tracker.log("    ❌ No se pudo asignar inglés en días consecutivos para %s", group_name)
     return False
 
 
 def force_assign_with_displacement(
     course, group_id, group_name, data, global_tracker,
     all_schedules, is_english, block_durations, max_attempts=50
-):
+) -> int:
     """
     FUERZA la asignación desplazando otros bloques si es necesario.
     Para INGLÉS: asigna en días CONSECUTIVOS (ej: Lun-Mar-Mié-Jue).
+    max_attempts acota los desplazamientos probados por bloque.
+    Devuelve las horas colocadas.
     """
     
-    prof_id = data.get_professor_for_group_course(group_id, course.id)
-    if not prof_id:
-        print(f"    ❌ No hay profesor para {course.name} en {group_name}")
-        return False
-    
-    room_id = data.get_professor_room(prof_id)
-    if not room_id:
-        print(f"    ❌ No hay aula para profesor {prof_id}")
-        return False
+    resolved = data.gc_resolved.get((group_id, course.id))
+    if resolved is None:
+        prof_id = data.get_professor_for_group_course(group_id, course.id)
+        if not prof_id:
+            global_tracker.log("    ❌ No hay profesor para %s en %s", course.name, group_name)
+        else:
+            global_tracker.log("    ❌ No hay aula para profesor %s", prof_id)
+        return 0
+    prof_id, room_id, prof_avail = resolved
     
     fixed_hour = global_tracker.get_fixed_hour_for_course(group_id, course.id) if is_english else None
     
     # INGLÉS: Asignar todos los bloques en días consecutivos
     if is_english and course.max_block_duration == 1:
-        return assign_english_consecutive_days(
+        placed = assign_english_consecutive_days(
             course, group_id, group_name, data, global_tracker,
             all_schedules, block_durations, fixed_hour, max_attempts
         )
+        return sum(block_durations) if placed else 0
     
     blocks_assigned = 0
+    hours_placed = 0
+    days = list(data.slots_by_day)
     
     for block_idx, duration in enumerate(block_durations):
         block_num = block_idx + 1
         assigned = False
-        attempts = 0
         
-        while not assigned and attempts < max_attempts:
-            attempts += 1
+        # Un barrido por posiciones libres y, si no alcanza, uno con desplazamiento.
+        # Sin cambios de estado entre medio, repetir el barrido daría el mismo resultado.
+        # Días con menos posiciones libres primero (desempate aleatorio)
+        domain = count_feasible_positions(
+            course, group_id, duration, data, global_tracker, is_english, fixed_hour
+        )
+        global_tracker.rng.shuffle(days)
+        days.sort(key=domain.get)
+        
+        for day in days:
+            if assigned or not domain[day]:
+                continue
             
-            days = list(data.slots_by_day.keys())
-            random.shuffle(days)
+            positions = find_all_valid_positions(
+                course, group_id, duration, day, data, global_tracker, is_english, fixed_hour
+            )
             
-            for day in days:
-                if assigned:
-                    break
+            if positions:
+                # La posición que menos demanda de otros pares consume (empates al azar)
+                least = min(p['demand'] for p in positions)
+                candidates = [p for p in positions if p['demand'] == least]
+                pos = candidates[global_tracker.rng.randrange(len(candidates))]
                 
-                if course.max_block_duration == 1:
-                    used_days = global_tracker.get_used_days_for_course(group_id, course.id)
-                    if day in used_days:
-                        continue
+                commit_block(pos, course, group_id, data, global_tracker, all_schedules)
+                
+                if is_english and fixed_hour is None:
+                    fixed_hour = pos['first_hour']
+                    global_tracker.set_fixed_hour_for_course(group_id, course.id, fixed_hour)
                 
-                positions = find_all_valid_positions(
+                blocks_assigned += 1
+                hours_placed += duration
+                assigned = True
+                global_tracker.log("       ✓ Bloque %s: %s %02d:00 (%sh)", block_num, day, pos['first_hour'], duration)
+        
+        if not assigned:
+            # Mejor primero: candidatos de todos los días ordenados por horas a mover (cota del
+            # trabajo). Los tapados por inglés no tienen salida (inglés no se mueve) y se descartan.
+            used_days = global_tracker.get_used_days_for_course(group_id, course.id) if course.max_block_duration == 1 else _NO_DAYS
+            candidates = []
+            for day in days:
+                if day in used_days:
+                    continue
+                for pos, conflicts in find_all_positions_with_conflicts(
                     course, group_id, duration, day, data, global_tracker, is_english, fixed_hour
+                ):
+                    if not any(c['is_english'] for c in conflicts):
+                        candidates.append((sum(len(c['hours']) for c in conflicts), pos, conflicts))
+            # sort estable: a igual cota se respeta el orden de días por dominio
+            candidates.sort(key=lambda c: c[0])
+            
+            # max_attempts es solo un tope: lo habitual es acertar en los primeros candidatos
+            for _, pos, conflicts in candidates[:max_attempts]:
+                # Si el bloque no se coloca, se deshacen los desplazamientos
+                mark = global_tracker.trail.checkpoint()
+                all_moved = all(
+                    try_relocate_block(conflict, data, global_tracker, all_schedules)
+                    for conflict in conflicts
                 )
                 
-                if positions:
-                    pos = random.choice(positions)
+                # Los desplazados eran los únicos bloqueos: basta un AND para confirmar
+                block_mask = data.slots_mask(pos['slot_ids'])
+                free = free_slots_mask(group_id, resolved, data, global_tracker) if all_moved else 0
+                if (free & block_mask) == block_mask:
+                    commit_block(pos, course, group_id, data, global_tracker, all_schedules)
                     
-                    block_id = f"G{group_id}_C{course.id}_B{block_num}"
-                    for j, slot_id in enumerate(pos['slot_ids']):
-                        hour_id = f"{block_id}_H{j}"
-                        all_schedules[group_id][hour_id] = (slot_id, pos['room_id'], course.id)
-                    
-                    global_tracker.assign(pos['prof_id'], group_id, pos['slot_ids'], course.id)
-                    data.mark_room_used(pos['room_id'], pos['slot_ids'])
-                    
-                    if course.max_block_duration == 1:
-                        global_tracker.add_day_for_course(group_id, course.id, day)
-                    
-                    if is_english and not fixed_hour:
+                    if is_english and fixed_hour is None:
                         fixed_hour = pos['first_hour']
                         global_tracker.set_fixed_hour_for_course(group_id, course.id, fixed_hour)
                     
                     blocks_assigned += 1
+                    hours_placed += duration
                     assigned = True
-                    print(f"       ✓ Bloque {block_num}: {day} {pos['first_hour']} ({duration}h)")
-            
-            if not assigned:
-                for day in days:
-                    if assigned:
-                        break
-                    
-                    if course.max_block_duration == 1:
-                        used_days = global_tracker.get_used_days_for_course(group_id, course.id)
-                        if day in used_days:
-                            continue
-                    
-                    day_slots = data.slots_by_day.get(day, [])
-                    
-                    for start_idx in range(len(day_slots) - duration + 1):
-                        if assigned:
-                            break
-                        
-                        consecutive = day_slots[start_idx:start_idx + duration]
-                        slot_ids = [s.id for s in consecutive]
-                        first_hour = consecutive[0].start_time
-                        
-                        if not data.is_professor_available_at_slots(prof_id, slot_ids):
-                            continue
-                        
-                        if is_english and fixed_hour and first_hour != fixed_hour:
-                            continue
-                        
-                        conflicts = get_conflicting_blocks(
-                            slot_ids, group_id, all_schedules, data, global_tracker
-                        )
-                        
-                        movable = [c for c in conflicts if not c['is_english']]
-                        
-                        if movable:
-                            all_moved = True
-                            moved_conflicts = []
-                            
-                            for conflict in movable:
-                                if try_relocate_block(conflict, data, global_tracker, all_schedules):
-                                    moved_conflicts.append(conflict)
-                                else:
-                                    all_moved = False
-                                    break
-                            
-                            if all_moved:
-                                positions = find_all_valid_positions(
-                                    course, group_id, duration, day, data, global_tracker, is_english, fixed_hour
-                                )
-                                
-                                if positions:
-                                    pos = positions[0]
-                                    
-                                    block_id = f"G{group_id}_C{course.id}_B{block_num}"
-                                    for j, slot_id in enumerate(pos['slot_ids']):
-                                        hour_id = f"{block_id}_H{j}"
-                                        all_schedules[group_id][hour_id] = (slot_id, pos['room_id'], course.id)
-                                    
-                                    global_tracker.assign(pos['prof_id'], group_id, pos['slot_ids'], course.id)
-                                    data.mark_room_used(pos['room_id'], pos['slot_ids'])
-                                    
-                                    if course.max_block_duration == 1:
-                                        global_tracker.add_day_for_course(group_id, course.id, day)
-                                    
-                                    if is_english and not fixed_hour:
-                                        fixed_hour = pos['first_hour']
-                                        global_tracker.set_fixed_hour_for_course(group_id, course.id, fixed_hour)
-                                    
-                                    blocks_assigned += 1
-                                    assigned = True
-                                    print(f"       ✓ Bloque {block_num}: {day} {pos['first_hour']} ({duration}h) [desplazamiento]")
+                    global_tracker.log("       ✓ Bloque %s: %s %02d:00 (%sh) [desplazamiento]", block_num, pos['day'], pos['first_hour'], duration)
+                    global_tracker.trail.release(mark)
+                    break
+                global_tracker.trail.rollback_to(mark)
         
         if not assigned:
-            print(f"       ❌ No se pudo asignar bloque {block_num} de {course.name}")
+            global_tracker.log("       ❌ No se pudo asignar bloque %s de %s", block_num, course.name)
     
-    success = blocks_assigned == len(block_durations)
-    
-    if success:
-        print(f"    ✅ {group_name} - {course.name}: {blocks_assigned}/{len(block_durations)} COMPLETO")
+    if blocks_assigned == len(block_durations):
+        global_tracker.log("    ✅ %s - %s: %s/%s COMPLETO", group_name, course.name, blocks_assigned, len(block_durations))
     else:
-        print(f"    ⚠️ {group_name} - {course.name}: {blocks_assigned}/{len(block_durations)} INCOMPLETO")
+        global_tracker.log("    ⚠️ %s - %s: %s/%s INCOMPLETO", group_name, course.name, blocks_assigned, len(block_durations))
     
-    return success
+    return hours_placed
+
+
+def course_deficits(group_id: int, group_courses: List[Course], course_hours) -> List[Tuple[Course, int]]:
+    """Materias del grupo con menos horas que las semanales, junto con las horas que ya tienen."""
+    return [
+        (course, assigned) for course in group_courses
+        if (assigned := course_hours.get((group_id, course.id), 0)) < course.weekly_hours
+    ]
 
 
 def generate_schedule_for_all_groups(
@@ -712,136 +990,116 @@ def generate_schedule_for_all_groups(
     professors: List[Professor],
     assignments: List[ProfessorCourseGroupAssignment],
     professor_rooms: Dict[int, int],
-    groups: List
-) -> Dict[int, ScheduleResult]:
+    groups: List,
+    seed: Optional[int] = None,
+    verbose: bool = False
+) -> Tuple[Dict[int, ScheduleResult], SummaryStats]:
     """
     Genera horarios SIN ESPACIOS VACÍOS.
     Inglés se asigna en días CONSECUTIVOS.
+    Con `seed` la corrida es reproducible; con `verbose` el progreso va al log (INFO).
+    Devuelve los horarios y el resumen de horas faltantes.
     """
     
-    print(f'\n{"="*60}')
-    print("🔥 GENERACIÓN FORZADA - SIN ESPACIOS VACÍOS")
-    print(f'{"="*60}')
-    
     data = SchedulingData(courses, rooms, timeslots, professors, assignments, professor_rooms)
-    global_tracker = GroupScheduleTracker()
-    all_schedules = {g.id: {} for g in groups}
+    global_tracker = GroupScheduleTracker(data.slot_index, seed, verbose)
+    progress = global_tracker.log
+    
+    progress("\n" + "="*60)
+    progress("🔥 GENERACIÓN FORZADA - SIN ESPACIOS VACÍOS")
+    progress("="*60)
     
-    unique_courses = {}
-    for assignment in assignments:
-        if assignment.course_id not in unique_courses:
-            course = data.courses.get(assignment.course_id)
-            if course:
-                unique_courses[assignment.course_id] = course
+    all_schedules = {g.id: {} for g in groups}
     
-    courses_list = list(unique_courses.values())
+    # Índices de asignaciones: una sola pasada en lugar de filtrar la lista en cada ciclo.
+    # La materia de cada asignación se resuelve aquí; las que no existen se descartan una vez.
+    courses_by_group: Dict[int, List[Course]] = defaultdict(list)
+    groups_by_course: Dict[int, Set[int]] = defaultdict(set)
+    for a in assignments:
+        groups_by_course[a.course_id].add(a.group_id)
+        course = data.courses.get(a.course_id)
+        if course:
+            courses_by_group[a.group_id].append(course)
     
-    english = [c for c in courses_list if 'inglés' in c.name.lower() or 'ingles' in c.name.lower()]
-    others = [c for c in courses_list if c not in english]
-    others.sort(key=lambda c: c.weekly_hours, reverse=True)
+    # Materias distintas en orden de aparición (dict.fromkeys deduplica conservando el orden)
+    courses_list = [data.courses[cid] for cid in dict.fromkeys(a.course_id for a in assignments) if cid in data.courses]
     
-    sorted_courses = english + others
+    english_ids: Set[int] = {c.id for c in courses_list if data.course_is_english[c.id]}
+    # Inglés primero (orden original), luego el resto por horas semanales descendente
+    sorted_courses = sorted(courses_list, key=lambda c: (0, 0) if c.id in english_ids else (1, -c.weekly_hours))
+    groups_by_id = {g.id: g for g in groups}
     
     for course in sorted_courses:
-        is_english = course in english
-        groups_with_course = list(set([a.group_id for a in assignments if a.course_id == course.id]))
+        is_english = course.id in english_ids
+        groups_with_course = groups_by_course[course.id]
         
-        print(f"\n📖 {course.name} ({course.weekly_hours}h, max={course.max_block_duration}h/bloque)")
+        progress("\n📖 %s (%sh, max=%sh/bloque)", course.name, course.weekly_hours, course.max_block_duration)
         
         block_durations = calculate_course_blocks(course)
         
+        # Secuencial a propósito: cada colocación lee y modifica las máscaras compartidas de
+        # profesores, aulas y grupos, y el desplazamiento puede mover bloques de otros grupos
         for group_id in groups_with_course:
-            group_name = next((g.name for g in groups if g.id == group_id), f"Grupo {group_id}")
+            group_name = groups_by_id[group_id].name if group_id in groups_by_id else f"Grupo {group_id}"
             
             force_assign_with_displacement(
                 course, group_id, group_name, data, global_tracker,
                 all_schedules, is_english, block_durations
             )
     
-    # Segunda pasada
-    print(f"\n{'='*60}")
-    print("🔄 SEGUNDA PASADA - VERIFICACIÓN Y CORRECCIÓN")
-    print(f'{"="*60}')
-    
+    # Faltantes tras la primera pasada; los desplazamientos no cambian las horas por materia
+    course_hours = global_tracker.course_hours
+    deficits = {}
     for group in groups:
-        courses_assigned = {}
-        for hour_id, (slot_id, room_id, course_id) in all_schedules[group.id].items():
-            if course_id not in courses_assigned:
-                courses_assigned[course_id] = 0
-            courses_assigned[course_id] += 1
+        for course, _ in course_deficits(group.id, courses_by_group[group.id], course_hours):
+            deficits[(group.id, course.id)] = (group, course)
+    
+    # Segunda pasada (solo si hay faltantes)
+    if deficits:
+        progress("\n" + "="*60)
+        progress("🔄 SEGUNDA PASADA - VERIFICACIÓN Y CORRECCIÓN")
+        progress("="*60)
+    
+    for group, course in deficits.values():
+        missing = course.weekly_hours - course_hours.get((group.id, course.id), 0)
+        progress("  ⚠️ %s - %s: faltan %sh, reintentando...", group.name, course.name, missing)
         
-        for assignment in assignments:
-            if assignment.group_id == group.id:
-                course = data.courses.get(assignment.course_id)
-                if course:
-                    assigned = courses_assigned.get(course.id, 0)
-                    if assigned < course.weekly_hours:
-                        missing = course.weekly_hours - assigned
-                        print(f"  ⚠️ {group.name} - {course.name}: faltan {missing}h, reintentando...")
-                        
-                        is_english = 'inglés' in course.name.lower() or 'ingles' in course.name.lower()
-                        extra_blocks = [1] * missing
-                        
-                        force_assign_with_displacement(
-                            course, group.id, group.name, data, global_tracker,
-                            all_schedules, is_english, extra_blocks, max_attempts=100
-                        )
+        is_english = course.id in english_ids
+        
+        force_assign_with_displacement(
+            course, group.id, group.name, data, global_tracker,
+            all_schedules, is_english, unit_blocks(missing), max_attempts=100
+        )
     
     # Resumen final
-    print(f"\n{'='*60}")
-    print("📊 RESUMEN FINAL")
-    print(f'{"="*60}')
+    progress("\n" + "="*60)
+    progress("📊 RESUMEN FINAL")
+    progress("="*60)
     
     total_missing = 0
+    per_group_missing: Dict[int, List[Tuple[int, int, int]]] = {}
     
     for group in groups:
-        unique_slots = set()
-        courses_in_schedule = {}
-        
-        for hour_id, (slot_id, room_id, course_id) in all_schedules[group.id].items():
-            unique_slots.add(slot_id)
-            if course_id not in courses_in_schedule:
-                courses_in_schedule[course_id] = 0
-            courses_in_schedule[course_id] += 1
+        # Columnas vivas del tracker: sin recorrer all_schedules ni desempaquetar tuplas
+        total_hours = global_tracker.group_mask.get(group.id, 0).bit_count()
+        group_courses = courses_by_group[group.id]
+        expected_hours = sum(c.weekly_hours for c in group_courses)
+        short = course_deficits(group.id, group_courses, course_hours)
         
-        total_hours = len(unique_slots)
-        expected_hours = 0
-        missing_list = []
+        for course, assigned in short:
+            per_group_missing.setdefault(group.id, []).append((course.id, assigned, course.weekly_hours))
+            total_missing += course.weekly_hours - assigned
         
-        for assignment in assignments:
-            if assignment.group_id == group.id:
-                course = data.courses.get(assignment.course_id)
-                if course:
-                    expected_hours += course.weekly_hours
-                    assigned = courses_in_schedule.get(course.id, 0)
-                    if assigned < course.weekly_hours:
-                        missing_list.append(f"{course.name}: {assigned}/{course.weekly_hours}")
-                        total_missing += course.weekly_hours - assigned
-        
-        if missing_list:
-            print(f"  ⚠️ {group.name}: {total_hours}/{expected_hours}h")
-            for m in missing_list:
-                print(f"     ❌ {m}")
+        if short:
+            progress("  ⚠️ %s: %s/%sh", group.name, total_hours, expected_hours)
+            for course, assigned in short:
+                progress("     ❌ %s: %s/%s", course.name, assigned, course.weekly_hours)
         else:
-            print(f"  ✅ {group.name}: {total_hours}/{expected_hours}h - COMPLETO")
+            progress("  ✅ %s: %s/%sh - COMPLETO", group.name, total_hours, expected_hours)
     
     if total_missing > 0:
-        print(f"\n⚠️ TOTAL FALTANTE: {total_missing} horas")
+        progress("\n⚠️ TOTAL FALTANTE: %s horas", total_missing)
     else:
-        print(f"\n🎉 ¡TODOS LOS HORARIOS 100% COMPLETOS!")
+        progress("\n🎉 ¡TODOS LOS HORARIOS 100% COMPLETOS!")
     
-    return all_schedules
-
-
-def generate_schedule(
-    courses: List[Course], 
-    rooms: List[Room], 
-    timeslots: List[TimeSlot],
-    professors: List[Professor],
-    assignments: List[ProfessorCourseGroupAssignment],
-    professor_rooms: Dict[int, int],
-    group_id: int = None, 
-    global_tracker: GroupScheduleTracker = None  
-) -> ScheduleResult:
-    """DEPRECADO: Usar generate_schedule_for_all_groups."""
-    return {}
\ No newline at end of file
+    return all_schedules, SummaryStats(total_missing, per_group_missing, total_missing == 0)